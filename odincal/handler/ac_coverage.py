@@ -22,11 +22,22 @@ def assert_acfile_has_data_coverage(
 ):
     bin_query = squeeze_query(
         """
-        WITH ac AS (
+        WITH indexed AS (
+            SELECT max_stw AS max,
+                min_stw AS min
+            FROM level0_file_index
+            WHERE file = $4
+                AND max_stw IS NOT NULL
+        ),
+        ac AS (
+            SELECT max, min
+            FROM indexed
+            UNION ALL
             SELECT max(stw) AS max,
                 min(stw) AS min
             FROM ac_level0
             WHERE file = $4
+                AND NOT EXISTS (SELECT 1 FROM indexed)
         ),
         buffer AS (
             SELECT min - 17 * 60 * 60 * $1 AS min,
@@ -56,7 +67,7 @@ def assert_acfile_has_data_coverage(
         shk_count AS (
             SELECT floor(stw /bin) * bin as stw_bin,
                 count(*) AS shk_cnt
-            FROM shk_level0,
+            FROM shk_level0_wide,
                 buffer,
                 bin_size
             WHERE stw BETWEEN buffer.min AND buffer.max
@@ -1,8 +1,16 @@
 import os
 import pkg_resources
 import StringIO
+import subprocess
 
 
 def create_datamodel():
     model = pkg_resources.resource_filename(__name__, 'create.sql')
     os.system('psql -f {}'.format(model))
+
+
+def backfill_shk_wide():
+    """fill shk_level0_wide with the housekeeping data that was imported
+    before the table existed"""
+    from odincal.shk_level0_wide import BACKFILL
+    subprocess.call(['psql', '-c', BACKFILL])
@@ -49,6 +49,23 @@ create table level0_files_in_process(
    constraint pk_level0_files_in_process_data primary key (file)
 );
 
+create table level0_file_index(
+   file varchar,
+   file_type varchar,
+   first_stw bigint,
+   last_stw bigint,
+   blocks int,
+   aero int,
+   astr int,
+   problem int,
+   nrows int,
+   min_stw bigint,
+   max_stw bigint,
+   created timestamp default current_timestamp,
+   constraint pk_level0_file_index primary key (file)
+);
+CREATE INDEX level0_file_index_stw_idx ON level0_file_index(first_stw, last_stw);
+
 
 
 
@@ -233,6 +250,37 @@ create table shk_level0(
    constraint pk_shklevel0_data primary key (stw,shk_type)
 );
 
+create table shk_level0_wide(
+   stw bigint,
+   file varchar,
+   LO495 real,
+   LO549 real,
+   LO555 real,
+   LO572 real,
+   SSB495 real,
+   SSB549 real,
+   SSB555 real,
+   SSB572 real,
+   mixC495 real,
+   mixC549 real,
+   mixC555 real,
+   mixC572 real,
+   imageloadA real,
+   imageloadB real,
+   hotloadA real,
+   hotloadB real,
+   mixerA real,
+   mixerB real,
+   lnaA real,
+   lnaB real,
+   mixer119A real,
+   mixer119B real,
+   warmifA real,
+   warmifB real,
+   created timestamp default current_timestamp,
+   constraint pk_shklevel0_wide_data primary key (stw)
+);
+
 
 create table shk_level1(
    stw bigint,
@@ -1,76 +1,96 @@
 import numpy
-from math import pi, sqrt, exp, cos
+from math import pi, sqrt, cos
+from multiprocessing import Pipe, Process
 from odincal.database import ConfiguredDatabase
-import ctypes
-from pkg_resources import resource_filename
 import psycopg2
-from psycopg2 import InternalError, IntegrityError
-from StringIO import StringIO
+from odincal.binary_copy import BinaryCopy
+from odincal.bulk_upsert import bulk_upsert
 from odincal.config import config
+from odincal.correlator import BAND_START, CHIPS, channel_slices
+from odincal.level1a_fft import get_fft
 from datetime import datetime
 from pg import DB
 import logging
+import os
+import traceback
 
 logger = logging.getLogger("odincal.ac_level1a_importer")
 
+# column types of ac_level1a for the binary COPY writer
+AC_LEVEL1A = ['int8', 'text', 'bytea', 'timestamp']
+
+
 class Level1a:
     """A class to process level 0 files into level 1a."""
 
-    def __init__(self):
+    def __init__(self, fft=None):
         self.LAGSPERCHIP = 96
         self.CLOCKFREQ = 224.0e6
         self.SAMPLEFREQ = 10.0e6
+        # the fft backend, see odincal.level1a_fft
+        self.fft = get_fft(fft)
 
     def reduceAC(self, cc_data, acd_mon_pos, acd_mon_neg):
-        self.got = []
+        """reduce a list of bands, the bands of the same width are
+        reduced together as a matrix"""
+        self.got = [None] * len(cc_data)
+        acd_mon_pos = numpy.asarray(acd_mon_pos, dtype='float64')
+        acd_mon_neg = numpy.asarray(acd_mon_neg, dtype='float64')
+        groups = {}
         for i in range(len(cc_data)):
-            self.maxchips = len(cc_data[i]) / 96
+            groups.setdefault(len(cc_data[i]), []).append(i)
+        for nlags, index in groups.items():
+            self.maxchips = nlags / self.LAGSPERCHIP
             self.nred = self.maxchips * 112
-            datamod = numpy.zeros(shape=(1, self.nred))
-            datamod[0, 0:self.maxchips * self.LAGSPERCHIP] = cc_data[i]
-            goti = self.reduce1Band(
-                datamod[
-                    0,
-                    :],
-                acd_mon_pos[i],
-                acd_mon_neg[i])
-            if goti[0] == 1:
-                self.got.append(goti[1])
-            else:
-                self.got.append(numpy.zeros(shape=(self.nred,)))
-
-    def reduce1Band(self, data, monitor_pos, monitor_neg):
-        zlag = data[0]
-        if zlag <= 0:
-            return 0, 0
-        if zlag > 1:
-            return 0, 0
+            datamod = numpy.zeros(shape=(len(index), self.nred))
+            datamod[:, 0:nlags] = [cc_data[i] for i in index]
+            data = self.reduceBands(
+                datamod, acd_mon_pos[index], acd_mon_neg[index])
+            for i, data0 in zip(index, data):
+                self.got[i] = data0
+
+    def reduceSpectra(self, modes, cc, acd_mon):
+        """reduce (N,) modes, (N, 8 * 96) lags and (N, 8, 2) monitors of
+        ac_level0 spectra into the (N, 8 * 112) level1a spectra, the
+        spectra with the same mode are reduced together"""
+        modes = numpy.asarray(modes, dtype=int) & 0xff
+        spectra = numpy.zeros(shape=(len(modes), 8 * 112))
+        for mode in numpy.unique(modes):
+            index = numpy.flatnonzero(modes == mode)
+            lags = cc[index].reshape(len(index), 8, self.LAGSPERCHIP)
+            monitors = acd_mon[index]
+            for start, chips, band in zip(
+                    BAND_START[mode], CHIPS[mode], channel_slices(mode)):
+                self.maxchips = len(chips)
+                self.nred = self.maxchips * 112
+                data = numpy.zeros(shape=(len(index), self.nred))
+                data[:, 0:self.maxchips * self.LAGSPERCHIP] = lags[
+                    :, start:start + self.maxchips].reshape(len(index), -1)
+                got = self.reduceBands(
+                    data, monitors[:, start, 0], monitors[:, start, 1])
+                spectra[index, band] = abs(got)
+        return spectra
+
+    def reduceBands(self, data, monitor_pos, monitor_neg):
+        """reduce a matrix of bands of the same width, with one band per
+        row, the rows of invalid bands are set to zero"""
+        zlag = data[:, 0]
         power = zeroLag(zlag, 1.0)
         c_pos = threshold(monitor_pos)
         c_neg = threshold(monitor_neg)
-        if (c_pos == 0 or c_neg == 0):
-            return 0, 0
-        else:
-            cmean = (c_pos + c_neg) / 2.0
+        cmean = (c_pos + c_neg) / 2.0
+        with numpy.errstate(divide='ignore', invalid='ignore'):
             dc = abs((c_pos - c_neg) / 2.0 / cmean)
-            if dc > 0.1:
-                return 0, 0
-        data = qCorrect(cmean, data, self.nred)
-        if data[0] == 0:
-            return 0, 0
-        # perform an fft of data
-        librarypath = resource_filename('oops', 'libfft.so')
-        logger.debug("loading fft.so {%s}", librarypath)
-        libc = ctypes.CDLL(librarypath, mode=3)
-        n0 = ctypes.c_int(112 * self.maxchips)
-        c_float_p = ctypes.POINTER(ctypes.c_double)
-        data0 = numpy.array(data[1])
-        data_p = data0.ctypes.data_as(c_float_p)
-        libc.odinfft(data_p, n0)
-        logger.debug("executed libfft.so successfully")
-        # Reintroduce power into filter shapes.
-        data0 = data0 * power
-        return 1, data0
+        valid = ((zlag > 0) & (zlag <= 1) & (c_pos != 0) & (c_neg != 0) &
+                 (dc <= 0.1))
+        valid &= qCorrect(cmean, data, self.nred)
+        got = numpy.zeros(data.shape)
+        if valid.any():
+            # perform an fft of data
+            got[valid] = self.fft(data[valid])
+            # Reintroduce power into filter shapes.
+            got[valid] *= power[valid, numpy.newaxis]
+        return got
 
 
 def hanning(data, n):
@@ -90,70 +110,111 @@ def inv_erfc(z):
 
 
 def threshold(monitor):
-    if (monitor < 0.0 or monitor > 1.0):
-        return 0.0
-    thr = sqrt(2.0) * inv_erfc(2.0 * monitor)
-    return thr
+    """thresholds of an array of monitor values, zero where the monitor
+    is out of range"""
+    monitor = numpy.asarray(monitor, dtype='float64')
+    valid = (monitor >= 0.0) & (monitor <= 1.0)
+    return numpy.where(valid, sqrt(2.0) * inv_erfc(2.0 * monitor), 0.0)
 
 
 def qCorrect(c, f, n):
+    """correct the first n lags of each row of f in place, with the
+    threshold c of the row, returns the rows where the level is low
+    enough for the correction"""
     # Perform quantisation correction using Kulkarni & Heiles approximation.
     # (taken from Kulkarni, S.R., Heiles, C., 1980, AJ, 85, 1413.
-    A = (pi / 2.0) * exp(c * c)
-    B = -A * A * A * (pow((c * c - 1), 2.0) / 6.0)
-    f[0] = 1.0
-    for i in range(1, n):
-        fa = f[i]
-        if (abs(fa) > 0.86):
-            # level too high in QCorrect
-            return 0, 0
-        f[i] = (A + B * fa * fa) * fa
-    return 1, f
+    c = numpy.asarray(c, dtype='float64')[:, numpy.newaxis]
+    A = (pi / 2.0) * numpy.exp(c * c)
+    B = -A * A * A * ((c * c - 1) ** 2 / 6.0)
+    f[:, 0] = 1.0
+    fa = f[:, 1:n]
+    # level too high in QCorrect
+    valid = ~(abs(fa) > 0.86).any(axis=1)
+    with numpy.errstate(over='ignore', invalid='ignore'):
+        fa[...] = (A + B * fa * fa) * fa
+    return valid
 
 
 def zeroLag(zlag, v):
-    if (zlag >= 1.0 or zlag <= 0.0):
-        return 0.0
-    x = v / inv_erfc(zlag)
-    return x * x / 2.0
-
-
-def get_seq(mode):
-    '''get the ac chip configuration from the mode parameter'''
-    seq = numpy.zeros(16)
-    seq.dtype = int
-    ssb = [1, -1, 1, -1, -1, 1, -1, 1]
-    mode = (mode << 1) | 1
-    for i in range(8):
-        if (mode & 1):
-            m = i
-        seq[2 * m] = seq[2 * m] + 1
-        mode >>= 1
-
-    for i in range(8):
-        if (seq[2 * i]):
-            if (ssb[i] < 0):
-                seq[2 * i + 1] = -1
-            else:
-                seq[2 * i + 1] = 1
+    """zero lag power of an array of zero lags, zero where the zero lag
+    is out of range"""
+    zlag = numpy.asarray(zlag, dtype='float64')
+    valid = (zlag < 1.0) & (zlag > 0.0)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        x = v / inv_erfc(zlag)
+    return numpy.where(valid, x * x / 2.0, 0.0)
+
+
+def _stack(values, shape):
+    """stack bytea values of float64 arrays into an array of shape
+    (len(values),) + shape"""
+    if not values:
+        return numpy.zeros((0,) + shape)
+    return numpy.frombuffer(
+        ''.join(values), dtype='float64').reshape((-1,) + shape)
+
+
+def get_workers(backend=None):
+    """the number of processes for the level1a reduction of a backend,
+    from the ODINCAL_LEVEL1A_WORKERS_<BACKEND> or ODINCAL_LEVEL1A_WORKERS
+    environment variables, or the workers option of the configuration"""
+    workers = config.get('level1a', 'workers')
+    workers = os.environ.get('ODINCAL_LEVEL1A_WORKERS', workers)
+    if backend is not None:
+        workers = os.environ.get(
+            'ODINCAL_LEVEL1A_WORKERS_{0}'.format(backend.upper()), workers)
+    return max(int(workers), 1)
+
+
+def _reduce_chunk(conn, modes, cc, acd_mon):
+    """reduce a chunk of spectra in a worker process and send the
+    result to the parent"""
+    try:
+        conn.send((True, Level1a().reduceSpectra(modes, cc, acd_mon)))
+    except Exception:
+        conn.send((False, traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def reduce_spectra(rows, workers=1):
+    """the level1a spectra of ac_level0 rows with acd_mon, cc and mode,
+    the rows are split into chunks that are reduced by workers processes
+    and the spectra are returned in the order of the rows"""
+    modes = numpy.array([row['mode'] for row in rows], dtype=int)
+    cc = _stack([row['cc'] for row in rows], (8 * 96,))
+    acd_mon = _stack([row['acd_mon'] for row in rows], (8, 2))
+    workers = min(workers, len(rows))
+    if workers <= 1:
+        return Level1a().reduceSpectra(modes, cc, acd_mon)
+    # the processes are forked, so the chunks are not copied to them,
+    # and pipes are used since pools need shared memory, which is not
+    # available in AWS Lambda
+    processes = []
+    for index in numpy.array_split(numpy.arange(len(rows)), workers):
+        receiver, sender = Pipe(False)
+        process = Process(
+            target=_reduce_chunk,
+            args=(sender, modes[index], cc[index], acd_mon[index]))
+        process.start()
+        sender.close()
+        processes.append((process, receiver))
+    spectra = []
+    errors = []
+    for process, receiver in processes:
+        try:
+            success, result = receiver.recv()
+        except EOFError:
+            success, result = False, 'worker exited with no result'
+        process.join()
+        if success:
+            spectra.append(result)
         else:
-            seq[2 * i + 1] = 0
-    chips = []
-    band_start = []
-    band = 0
-    '''chips is a list of vectors'''
-    '''for example chips=[[0], [1, 2, 3, 4], [5, 6, 7]] gives
-       that we observe three bands: the first is
-       from a single chip, for second band chip 1,2,3,4 are cascaded,
-       for third band chip 5,6,7 are cascaded'''
-    for ind, se in enumerate(seq):
-        if ind == band:
-            band_start.append(ind / 2)
-            chips.append(range(ind / 2, ind / 2 + se))
-            band = ind + 2 * se
-    band_start = numpy.array(band_start)
-
-    return seq, chips, band_start
+            errors.append(result)
+    if errors:
+        raise RuntimeError(
+            'level1a reduction failed:\n{0}'.format('\n'.join(errors)))
+    return numpy.concatenate(spectra)
 
 
 def ac_level1a_importer(stwa, stwb, backend, pg_string=None):
@@ -168,68 +229,29 @@ def ac_level1a_importer(stwa, stwb, backend, pg_string=None):
                  left join ac_level1a using (backend,stw)
                  where ac_level1a.stw is Null
                  and ac_level0.stw>={0} and ac_level0.stw<={1}
-                 and ac_level0.backend='{2}' '''.format(*temp))
+                 and ac_level0.backend='{2}'
+                 order by ac_level0.stw '''.format(*temp))
 
     result = query.dictresult()
-    ac = Level1a()
-    fgr = StringIO()
     logger.debug(
         "Found %i %s spectrum in the STW range  [%i,%i] ",
         len(result), backend, stwa, stwb
     )
-    for ind, rowb in enumerate(result):
-        acd_mon = numpy.ndarray(shape=(8, 2), dtype='float64',
-                                buffer=rowb['acd_mon'])
-        cc = numpy.ndarray(shape=(8 * 96,), dtype='float64',
-                           buffer=rowb['cc'])
-        # xheck the mode of the correlator configuration
-        seq, chips, band_start = get_seq(rowb['mode'])
-        # make a list with of vectors with cc-data for the band
-        # to process, take mode into account
-        cclist = []
-        for ind, band in enumerate(band_start):
-            cclist.append(cc[band * 96:(band + len(chips[ind])) * 96, ])
-
-        ac.reduceAC(cclist, acd_mon[band_start, 0], acd_mon[band_start, 1])
-
-        a = numpy.zeros(shape=(8 * 112,))
-        for ind, band in enumerate(band_start):
-            a[band * 112:(band + len(chips[ind])) * 112] = ac.got[ind]
-        fgr.write(
-            str(rowb['stw']) + '\t' +
-            str(rowb['backend']) + '\t' +
-            '\\\\x' + abs(a).tostring().encode('hex') + '\t' +
-            str(datetime.now()) + '\n')
+    spectra = reduce_spectra(result, get_workers(backend))
+    fgr = BinaryCopy(AC_LEVEL1A)
+    fgr.write(
+        [rowb['stw'] for rowb in result],
+        [rowb['backend'] for rowb in result],
+        spectra,
+        datetime.now())
+    data = fgr.getvalue()
+    fgr.close()
 
     if pg_string is None:
         conn = psycopg2.connect(config.get('database', 'pgstring'))
     else:
         conn = psycopg2.connect(pg_string)
-    cur = conn.cursor()
-    fgr.seek(0)
-    cur.execute("create temporary table foo ( like ac_level1a );")
-    cur.copy_from(file=fgr, table='foo')
-    try:
-        cur.execute(
-            "delete from ac_level1a ac using foo f where f.stw=ac.stw and ac.backend=f.backend")  # noqa
-        cur.execute("insert into ac_level1a (select * from foo)")
-    except (IntegrityError, InternalError) as e:
-        logger.info("Got errors inserting into ac_level1a: %s", e)
-        try:
-            conn.rollback()
-            cur.execute("create temporary table foo ( like ac_level1a );")
-            cur.copy_from(file=fgr, table='foo')
-            cur.execute(
-                "delete from ac_level1a ac using foo f where f.stw=ac.stw and ac.backend=f.backend")  # noqa
-            cur.execute("insert into ac_level1a (select * from foo)")
-        except (IntegrityError, InternalError) as e1:
-            logger.warning("Error retrying inserting ac_level1a data: %s", e1)
-            conn.rollback()
-            conn.close()
-            con.close()
-            return 1
-    fgr.close()
-    conn.commit()
+    success = bulk_upsert(conn, 'ac_level1a', data, key=('backend', 'stw'))
     conn.close()
     con.close()
-    return 0
+    return 0 if success else 1
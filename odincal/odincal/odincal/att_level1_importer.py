@@ -1,8 +1,8 @@
 from oops import odin
 import numpy
 import psycopg2
-from StringIO import StringIO
-from psycopg2 import InternalError, IntegrityError
+from odincal.binary_copy import BinaryCopy
+from odincal.bulk_upsert import bulk_upsert
 from odincal.config import config
 from odincal.database import ConfiguredDatabase
 from datetime import datetime
@@ -11,15 +11,85 @@ import logging
 
 logger = logging.getLogger('att_level1_importer')
 
+# column types of attitude_level1 for the binary COPY writer
+ATTITUDE_LEVEL1 = [
+    'int8', 'text', 'int4', 'float8', 'float4', 'float8', 'float4', 'float4',
+    'float4', 'int4', 'float4', 'float4', 'float4', 'float8[]', 'float8[]',
+    'float8[]', 'float8[]', 'float8[]', 'float8[]', 'float8[]', 'float4',
+    'float4', 'float4', 'int4', 'timestamp']
+
+# the results of odin.Attitudes written to attitude_level1
+ATTITUDE_COLUMNS = [
+    'mjd', 'lst', 'orbit', 'latitude', 'longitude', 'altitude', 'skybeamhit',
+    'ra2000', 'dec2000', 'vsource', 'qtarget', 'qachieved', 'qerror',
+    'gpspos', 'gpsvel', 'sunpos', 'moonpos', 'sunzd', 'vgeo', 'vlsr', 'level']
+
 
 def djl(year, mon, day, hour, min, secs):
     dn = 367 * year - 7 * (year + (mon + 9) / 12) / 4 \
         - 3 * ((year + (mon - 9) / 7) / 100 + 1) / 4 + 275 * mon / 9 \
         + day + 1721029
-    jd = float(dn) - 0.5 + (hour + (min + secs / 60.0) / 60.0) / 24.0
+    jd = dn - 0.5 + (hour + (min + secs / 60.0) / 60.0) / 24.0
     return jd
 
 
+def get_attitude_lookup(con, stwa, stwb, soda):
+    """the attitude_level0 data of soda needed for the spectra in the stw
+    range [stwa, stwb], as an array of stw and a lookup matrix with a
+    row of (JD, orbit, qt, qa, qe, gps, acs) per stw, sorted by stw"""
+    query = con.query('''select year,mon,day,hour,min,secs,stw,
+                       orbit,qt,qa,qe,gps,acs
+                       from attitude_level0 where
+                       stw>{0}-200 and stw<{1}+200
+                       and soda={2}
+                       and qt!='{{0,0,0,0}}' and qa!='{{0,0,0,0}}'
+                       order by stw'''.format(stwa, stwb, soda))
+    result = query.dictresult()
+    cols = 2 + 2 * 4 + 3 + 6 + 1
+    lookup = numpy.zeros(shape=(len(result), cols))
+    attstw = numpy.array([row['stw'] for row in result], dtype=float)
+    if not result:
+        return attstw, lookup
+
+    def column(name, dtype=float):
+        return numpy.array([row[name] for row in result], dtype=dtype)
+
+    # fill up the lookup table with data
+    lookup[:, 0] = djl(column('year', int), column('mon', int),
+                       column('day', int), column('hour', int),
+                       column('min', int), column('secs'))
+    lookup[:, 1] = column('orbit')
+    lookup[:, 2:6] = column('qt')
+    lookup[:, 6:10] = column('qa')
+    lookup[:, 10:13] = column('qe')
+    lookup[:, 13:19] = column('gps')
+    lookup[:, 19] = column('acs')
+    return attstw, lookup
+
+
+def interpolate_attitude(attstw, lookup, stws, midpoints):
+    """interpolate the lookup matrix to the midpoints of the spectra with
+    the given stws, returns a mask of the spectra with attitude data on
+    both sides of the midpoint within 200 stw of the spectrum, and the
+    interpolated rows of these spectra"""
+    stws = numpy.asarray(stws, dtype=float)
+    midpoints = numpy.asarray(midpoints, dtype=float)
+    # the index of the lowest stw above the desired stw
+    ind = numpy.searchsorted(attstw, midpoints, side='right')
+    valid = (ind > 0) & (ind < len(attstw))
+    i = ind[valid]
+    valid[valid] = ((attstw[i - 1] > stws[valid] - 200) &
+                    (attstw[i] < stws[valid] + 200))
+    i = ind[valid]
+    stw = midpoints[valid, numpy.newaxis]
+    # now interpolate
+    dt = (attstw[i] - attstw[i - 1])[:, numpy.newaxis]
+    dt0 = attstw[i, numpy.newaxis] - stw
+    dt1 = stw - attstw[i - 1, numpy.newaxis]
+    att = (dt0 * lookup[i - 1, :] + dt1 * lookup[i, :]) / dt
+    return valid, att
+
+
 def att_level1_importer(stwa, stwb, soda, backend, pg_string=None):
     # soda=argv[1]
     temp = [stwa, stwb, soda, backend]
@@ -40,89 +110,20 @@ def att_level1_importer(stwa, stwb, soda, backend, pg_string=None):
         "Got %i spectrum matching soda: %i and stw: [%i,%i]",
         spectra_to_process, soda, stwa, stwb
     )
-    success_counter = 0
-    fgr = StringIO()
-    for sig in sigresult:
-        keys = [sig['stw'], soda]
-        query = con.query('''select year,mon,day,hour,min,secs,stw,
-                           orbit,qt,qa,qe,gps,acs
-                           from attitude_level0 where
-                           stw>{0}-200 and stw<{0}+200
-                           and soda={1}
-                           and qt!='{{0,0,0,0}}' and qa!='{{0,0,0,0}}'
-                           order by stw'''.format(*keys))
-        result = query.dictresult()
-        logger.debug("Got %i att data rows matching %i", len(result), sig['stw'])
-        if len(result) > 0:
-            # interpolate attitude data to desired stw
-            # before doing the actual processing
-            stw = float(sig['stw']) - sig['inttime'] * 16.0 / 2.0
-            # first create a lookup matrix
-            cols = 2 + 2 * 4 + 3 + 6 + 1
-            rows = len(result)
-            lookup = numpy.zeros(shape=(rows, cols))
-            attstw = numpy.zeros(shape=(rows,))
-            for index, row in enumerate(result):
-                attstw[index] = float(row['stw'])
-                # extract database data
-                JD = djl(row['year'], row['mon'], row['day'],
-                         row['hour'], row['min'], row['secs'])
-                # fill up the lookup table with data
-                lookup[index, 0: 2] = numpy.array((JD, row['orbit']))
-                lookup[index, 2: 6] = numpy.array(row['qt'])
-                lookup[index, 6:10] = numpy.array(row['qa'])
-                lookup[index, 10:13] = numpy.array(row['qe'])
-                lookup[index, 13:19] = numpy.array(row['gps'])
-                lookup[index, 19] = row['acs']
-            # search for the index with the lowest stw
-            # above the desired stw in the lookup table
-            ind = (attstw > stw).nonzero()[0]
-            if len(ind) == 0:
-                continue
-                # not enough match
-            if ind[0] == 0:
-                continue
-                # not enough match
-            i = ind[0]
-            # now interpolate
-            dt = attstw[i] - attstw[i - 1]
-            dt0 = attstw[i] - stw
-            dt1 = stw - attstw[i - 1]
-            att = (dt0 * lookup[i - 1, :] + dt1 * lookup[i, :]) / dt
-            t = (att[0], long(stw), att[1],
-                 tuple(att[2:6]), tuple(att[6:10]),
-                 tuple(att[10:13]), tuple(att[13:19]), att[19])
-            # now process data using Ohlbergs code (s.Attitude(t))
-            logger.debug('Using s.Attitude(%s)', t)
-            s = odin.Spectrum()
-            s.stw = long(stw)
-            s.Attitude(t)
-            fgr.write(str(sig['stw']) + '\t' +
-                      str(sig['backend']) + '\t' +
-                      str(soda) + '\t' +
-                      str(s.mjd) + '\t' +
-                      str(s.lst) + '\t' +
-                      str(s.orbit) + '\t' +
-                      str(s.latitude) + '\t' +
-                      str(s.longitude) + '\t' +
-                      str(s.altitude) + '\t' +
-                      str(s.skybeamhit) + '\t' +
-                      str(s.ra2000) + '\t' +
-                      str(s.dec2000) + '\t' +
-                      str(s.vsource) + '\t' +
-                      str("{{{},{},{},{}}}".format(*s.qtarget)) + '\t' +
-                      str("{{{},{},{},{}}}".format(*s.qachieved)) + '\t' +
-                      str("{{{},{},{}}}".format(*s.qerror)) + '\t' +
-                      str("{{{},{},{}}}".format(*s.gpspos)) + '\t' +
-                      str("{{{},{},{}}}".format(*s.gpsvel)) + '\t' +
-                      str("{{{},{},{}}}".format(*s.sunpos)) + '\t' +
-                      str("{{{},{},{}}}".format(*s.moonpos)) + '\t' +
-                      str(s.sunzd) + '\t' +
-                      str(s.vgeo) + '\t' +
-                      str(s.vlsr) + '\t' +
-                      str(s.level) + '\t' +
-                      str(datetime.now()) + '\n')
-            success_counter = success_counter +1
+    # interpolate attitude data to desired stw
+    # before doing the actual processing
+    attstw, lookup = get_attitude_lookup(con, stwa, stwb, soda)
+    logger.debug("Got %i att data rows", len(attstw))
+    stws = [sig['stw'] for sig in sigresult]
+    midpoints = [float(sig['stw']) - sig['inttime'] * 16.0 / 2.0
+                 for sig in sigresult]
+    valid, atts = interpolate_attitude(attstw, lookup, stws, midpoints)
+    # now process data using Ohlbergs code, for all spectra at once
+    attitudes = odin.Attitudes(
+        numpy.asarray(midpoints)[valid].astype('uint64'),
+        atts[:, 0], atts[:, 1], atts[:, 2:6], atts[:, 6:10],
+        atts[:, 10:13], atts[:, 13:19], atts[:, 19])
+    success_counter = int(valid.sum())
     logger.info(
         "Successfully created %i of %i attitude entries",
         success_counter,
@@ -132,34 +133,18 @@ def att_level1_importer(stwa, stwb, soda, backend, pg_string=None):
         conn = psycopg2.connect(config.get('database', 'pgstring'))
     else:
         conn = psycopg2.connect(pg_string)
-    cur = conn.cursor()
-    fgr.seek(0)
-    logger.debug('Insert resulting data in temp table')
-    cur.execute("create temporary table foo ( like attitude_level1 );")
-    cur.copy_from(file=fgr, table='foo')
-    try:
-        cur.execute(
-            "delete from attitude_level1 ac using foo f where f.stw=ac.stw and ac.backend=f.backend")  # noqa
-        cur.execute("insert into attitude_level1 (select * from foo)")
-    except (IntegrityError, InternalError) as e:
-        logger.info("Got error inserting data into temp table: %s", e)
-        try:
-            conn.rollback()
-            cur.execute("create temporary table foo ( like attitude_level1 );")
-            cur.copy_from(file=fgr, table='foo')
-            cur.execute(
-                "delete from attitude_level1 ac using foo f where f.stw=ac.stw and ac.backend=f.backend")  # noqa
-            cur.execute("insert into attitude_level1 (select * from foo)")
-
-        except (IntegrityError, InternalError) as e1:
-            logger.warning("Got another error inserting data: %s", e1)
-            conn.rollback()
-            conn.close()
-            con.close()
-            return 1
-
+    fgr = BinaryCopy(ATTITUDE_LEVEL1)
+    fgr.write(
+        [sig['stw'] for sig, ok in zip(sigresult, valid) if ok],
+        [sig['backend'] for sig, ok in zip(sigresult, valid) if ok],
+        soda,
+        *([attitudes[name] for name in ATTITUDE_COLUMNS] + [datetime.now()]))
+    data = fgr.getvalue()
     fgr.close()
-    conn.commit()
+    # older rows of the spectra are replaced, whatever their soda
+    success = bulk_upsert(
+        conn, 'attitude_level1', data, key=('stw', 'backend', 'soda'),
+        replace=('stw', 'backend'))
     conn.close()
     con.close()
-    return 0
+    return 0 if success else 1
@@ -0,0 +1,313 @@
+'''
+Writer of the PostgreSQL binary COPY format.
+
+Instead of writing the rows as text, with bytea columns hex encoded, whole
+columns of data are encoded at once into the binary COPY format, where
+bytea and numeric columns are sent natively. A table is described by a
+list of column types, and a batch of rows by one value per column: either
+an array (or list) with one element or row per database row, or a scalar
+that is repeated on every row.
+
+    buf = BinaryCopy(['int8', 'text', 'float8[]', 'bytea', 'timestamp'])
+    buf.write(stws, 'AC1', quaternions, spectra, datetime.now())
+    copy_binary(cursor, 'foo', buf.getvalue())
+
+Rows can also be streamed into the database while they are produced,
+with at most a few encoded batches held in memory:
+
+    copy_binary(cursor, 'foo', CopyStream(iter_copy(types, batches)))
+
+Supported types are int2, int4, int8, float4, float8 and timestamp,
+one dimensional arrays of the numeric types (e.g. 'float8[]'), and
+text and bytea. Enum and varchar columns are written as text. Text and
+bytea values, and the values of a list of numbers, may be None, which is
+written as NULL.
+'''
+from datetime import datetime
+from io import BytesIO
+from Queue import Queue
+from threading import Event, Thread
+import sys
+import numpy
+
+HEADER = 'PGCOPY\n\xff\r\n\0' + '\0\0\0\0' + '\0\0\0\0'
+TRAILER = '\xff\xff'
+EPOCH = datetime(2000, 1, 1)
+
+NUMERIC = {
+    'int2': '>i2',
+    'int4': '>i4',
+    'int8': '>i8',
+    'float4': '>f4',
+    'float8': '>f8',
+    'timestamp': '>i8',
+}
+
+ELEMENT_OIDS = {
+    'int2': 21,
+    'int4': 23,
+    'int8': 20,
+    'float4': 700,
+    'float8': 701,
+}
+
+
+class BinaryCopy(object):
+    """A buffer of rows in the binary COPY format"""
+
+    def __init__(self, types):
+        self.types = types
+        self.buffer = BytesIO()
+        self.buffer.write(HEADER)
+
+    def write(self, *columns):
+        self.buffer.write(encode(self.types, columns))
+
+    def getvalue(self):
+        return self.buffer.getvalue() + TRAILER
+
+    def close(self):
+        self.buffer.close()
+
+
+class CopyStream(object):
+    """A file like object with data in the binary COPY format that is
+    produced by a background thread while it is read. At most maxsize
+    chunks of data are waiting to be read at any time. When the stream
+    is closed before it is read to the end, the producer stops after the
+    chunk at hand."""
+
+    def __init__(self, chunks, maxsize=4):
+        self.queue = Queue(maxsize)
+        self.chunk = ''
+        self.position = 0
+        self.done = False
+        self.error = None
+        self.stopped = Event()
+        self.thread = Thread(target=self._produce, args=(chunks,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _produce(self, chunks):
+        try:
+            for chunk in chunks:
+                if self.stopped.is_set():
+                    break
+                self.queue.put(chunk)
+        except Exception:
+            self.error = sys.exc_info()
+        finally:
+            self.queue.put(None)
+
+    def read(self, size=-1):
+        while self.position >= len(self.chunk):
+            if self.done:
+                return ''
+            chunk = self.queue.get()
+            if chunk is None:
+                self.done = True
+                self.raise_error()
+            else:
+                self.chunk = chunk
+                self.position = 0
+        if size < 0:
+            size = len(self.chunk) - self.position
+        data = self.chunk[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+    def raise_error(self):
+        """raise the error of the producer, if any"""
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def close(self):
+        # stop the producer if the data was not read to the end, and
+        # take its chunks from the queue until it has seen that
+        self.stopped.set()
+        while not self.done:
+            self.done = self.queue.get() is None
+        self.thread.join()
+
+
+def iter_copy(types, batches):
+    """the binary COPY data of batches of rows, given as one value per
+    column (see encode)"""
+    yield HEADER
+    for columns in batches:
+        yield encode(types, columns)
+    yield TRAILER
+
+
+def copy_binary(cursor, table, data, size=65536):
+    """copy data in the binary COPY format (a string or a file like
+    object) into table"""
+    if isinstance(data, str):
+        data = BytesIO(data)
+    try:
+        cursor.copy_expert(
+            'copy {0} from stdin with binary'.format(table), data, size)
+    finally:
+        if isinstance(data, CopyStream):
+            data.close()
+    if isinstance(data, CopyStream):
+        data.raise_error()
+
+
+def encode(types, columns):
+    """encode a batch of rows given as one value per column"""
+    nrows = None
+    columns = list(columns)
+    nulls = {}
+    for ind, kind in enumerate(types):
+        if kind == 'bytea' and _is_array(columns[ind]):
+            pass
+        elif kind in ELEMENT_OIDS and _has_null(columns[ind]):
+            nulls[ind] = numpy.array(
+                [value is None for value in columns[ind]])
+            columns[ind] = numpy.array(
+                [0 if value is None else value for value in columns[ind]])
+        elif kind in ('text', 'bytea'):
+            if not _is_string(columns[ind]):
+                columns[ind] = [_string(value) for value in columns[ind]]
+        elif kind == 'timestamp':
+            columns[ind] = _timestamps(columns[ind])
+        else:
+            columns[ind] = numpy.asarray(columns[ind])
+        if not _is_scalar(kind, columns[ind]):
+            nrows = len(columns[ind])
+    if nrows is None:
+        nrows = 1
+    if nrows == 0:
+        return ''
+    # the row layout depends on the length of variable width values,
+    # so rows are encoded in groups with the same lengths
+    variable = [ind for ind, kind in enumerate(types)
+                if (kind in ('text', 'bytea') and
+                    not _is_string(columns[ind]) and
+                    not isinstance(columns[ind], numpy.ndarray)) or
+                ind in nulls]
+    if not variable:
+        return _encode_rows(types, columns, numpy.arange(nrows), {})
+    lengths = numpy.array(
+        [numpy.where(nulls[ind], -1, 0) if ind in nulls else
+         [-1 if value is None else len(value) for value in columns[ind]]
+         for ind in variable]).T
+    signatures, groups = numpy.unique(lengths, axis=0, return_inverse=True)
+    rows = []
+    for group, signature in enumerate(signatures):
+        index = numpy.flatnonzero(groups == group)
+        rows.append(_encode_rows(
+            types, columns, index, dict(zip(variable, signature))))
+    return ''.join(rows)
+
+
+def _encode_rows(types, columns, index, lengths):
+    fields = [('count', '>i2')]
+    values = [(('count',), len(types))]
+    for ind, kind in enumerate(types):
+        column = columns[ind]
+        name = 'c{0}'.format(ind)
+        if kind not in ('text', 'bytea') and not _is_scalar(kind, column):
+            column = column[index]
+        if kind.endswith('[]'):
+            element = numpy.dtype(NUMERIC[kind[:-2]])
+            size = column.shape[-1]
+            fields.append((name, [
+                ('length', '>i4'), ('ndim', '>i4'), ('hasnull', '>i4'),
+                ('oid', '>i4'), ('dim', '>i4'), ('lbound', '>i4'),
+                ('elements', [('length', '>i4'), ('value', element)],
+                 (size,))]))
+            values.extend([
+                ((name, 'length'), 20 + size * (4 + element.itemsize)),
+                ((name, 'ndim'), 1),
+                ((name, 'oid'), ELEMENT_OIDS[kind[:-2]]),
+                ((name, 'dim'), size),
+                ((name, 'lbound'), 1),
+                ((name, 'elements', 'length'), element.itemsize),
+                ((name, 'elements', 'value'), column)])
+        elif kind in NUMERIC and lengths.get(ind) == -1:
+            # a null number
+            fields.append((name, [('length', '>i4')]))
+            values.append(((name, 'length'), -1))
+        elif kind in NUMERIC:
+            element = numpy.dtype(NUMERIC[kind])
+            fields.append((name, [('length', '>i4'), ('value', element)]))
+            values.extend([
+                ((name, 'length'), element.itemsize),
+                ((name, 'value'), column)])
+        elif isinstance(column, numpy.ndarray):
+            # bytea with the raw bytes of an array row
+            column = numpy.ascontiguousarray(column[index])
+            size = column[0].nbytes if len(column) else 0
+            column = column.view('u1').reshape(len(index), size)
+            fields.append((name, [('length', '>i4'), ('value', 'u1', size)]))
+            values.extend([
+                ((name, 'length'), size),
+                ((name, 'value'), column)])
+        else:
+            if _is_string(column):
+                length = -1 if column is None else len(column)
+            else:
+                length = lengths[ind]
+                column = [column[i] for i in index]
+            if length > 0:
+                fields.append((name, [('length', '>i4'),
+                                      ('value', 'S{0}'.format(length))]))
+                values.append(((name, 'value'), column))
+            else:
+                fields.append((name, [('length', '>i4')]))
+            values.append(((name, 'length'), length))
+    rows = numpy.zeros(len(index), dtype=fields)
+    for path, value in values:
+        view = rows
+        for key in path:
+            view = view[key]
+        view[...] = value
+    return rows.tostring()
+
+
+def _is_string(value):
+    return value is None or isinstance(value, basestring)
+
+
+def _has_null(column):
+    return (isinstance(column, (list, tuple)) or
+            isinstance(column, numpy.ndarray) and column.dtype.kind == 'O'
+            ) and any(value is None for value in column)
+
+
+def _is_array(value):
+    return (isinstance(value, numpy.ndarray) and
+            value.dtype.kind not in ('O', 'S', 'U'))
+
+
+def _is_scalar(kind, column):
+    if kind in ('text', 'bytea'):
+        return _is_string(column)
+    if kind.endswith('[]'):
+        return numpy.ndim(column) == 1
+    return numpy.ndim(column) == 0
+
+
+def _string(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, numpy.ndarray):
+        return value.tostring()
+    return str(value)
+
+
+def _timestamp(value):
+    delta = value - EPOCH
+    return ((delta.days * 86400 + delta.seconds) * 1000000 +
+            delta.microseconds)
+
+
+def _timestamps(column):
+    """microseconds since 2000-01-01 of a datetime or a column of them"""
+    if isinstance(column, datetime):
+        return numpy.int64(_timestamp(column))
+    return numpy.array([_timestamp(value) for value in column], dtype='int64')
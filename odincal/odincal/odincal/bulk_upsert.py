@@ -0,0 +1,72 @@
+"""Bulk upsert of rows into the level1 tables.
+
+The rows are copied, in the binary COPY format, into a temporary staging
+table like the target table, and then merged into the target table with
+a single insert ... on conflict statement. Rows of the target table with
+the same replace key as a staged row, but another primary key, can be
+deleted before the merge, e.g. attitude_level1 rows of an older soda
+version. For the keep columns a null in a staged row does not replace
+the value of an existing row. The merge is done in one transaction, and
+it is retried once on integrity errors, with the same data copied again.
+
+    buf = BinaryCopy(AC_LEVEL1A)
+    buf.write(stws, backend, spectra, datetime.now())
+    bulk_upsert(conn, 'ac_level1a', buf.getvalue(), key=('backend', 'stw'))
+"""
+import logging
+
+from psycopg2 import InternalError, IntegrityError
+
+from odincal.binary_copy import copy_binary
+
+logger = logging.getLogger('odincal.bulk_upsert')
+
+STAGING = 'foo'
+
+
+def merge_sql(table, columns, key, replace=None, keep=()):
+    """the statement that merges the staging table into table"""
+    sql = ''
+    if replace:
+        sql += 'delete from {0} t using {1} f where {2};'.format(
+            table, STAGING, ' and '.join(
+                't.{0}=f.{0}'.format(column) for column in replace))
+    update = [column for column in columns if column not in key]
+    sql += 'insert into {0} ({1}) select {1} from {2} '.format(
+        table, ','.join(columns), STAGING)
+    sql += 'on conflict ({0}) '.format(','.join(key))
+    if update:
+        sql += 'do update set {0}'.format(','.join(
+            '{0}=coalesce(excluded.{0},{1}.{0})'.format(column, table)
+            if column in keep else '{0}=excluded.{0}'.format(column)
+            for column in update))
+    else:
+        sql += 'do nothing'
+    return sql
+
+
+def bulk_upsert(conn, table, data, key, replace=None, keep=(), retries=1):
+    """upsert data in the binary COPY format into table, where key is the
+    primary key of the table, and commit; returns True on success"""
+    for attempt in range(retries + 1):
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "create temporary table {0} ( like {1} ) on commit drop;"
+                .format(STAGING, table))
+            copy_binary(cur, STAGING, data)
+            cur.execute('select * from {0} limit 0'.format(STAGING))
+            columns = [column[0] for column in cur.description]
+            cur.execute(merge_sql(table, columns, key, replace, keep))
+            conn.commit()
+            return True
+        except (IntegrityError, InternalError) as error:
+            conn.rollback()
+            if attempt < retries:
+                logger.info("Got errors upserting into %s: %s", table, error)
+            else:
+                logger.warning(
+                    "Error retrying upserting into %s: %s", table, error)
+        finally:
+            cur.close()
+    return False
@@ -1,8 +1,11 @@
+from bisect import bisect_left, bisect_right
 from sys import argv
+import numpy
 from odincal.ac_level1a_importer import ac_level1a_importer
 from odincal.att_level1_importer import att_level1_importer
 from odincal.shk_level1_importer import shk_level1_importer
 from odincal.database import ConfiguredDatabase
+from odincal.level0_index import get_index
 
 
 EARTH1 = 0x0001
@@ -19,6 +22,79 @@ class BadBack(Exception):
     pass
 
 
+# the shapes of the blobs of a calibration window row
+BLOB_SHAPES = {
+    'spectra': (112 * 8,),
+    'cc': (8, 96),
+}
+
+
+class CalibrationWindow(object):
+    '''The rows of a calibration window, held as one numpy array per
+    column: the spectra as an (N, 896) and the correlation coefficients
+    as an (N, 8, 96) float64 matrix, and the other columns as typed
+    vectors (or matrices, for array columns). The arrays are read only.
+
+    Indexing the window gives a view of a row that can be used like a
+    row of dictresult. Rows with a blob that is null, or not of the
+    size of its shape, are left out of the window.'''
+
+    def __init__(self, fields, rows):
+        blobs = [(ind, 8 * numpy.prod(BLOB_SHAPES[field]))
+                 for ind, field in enumerate(fields) if field in BLOB_SHAPES]
+        rows = [row for row in rows
+                if all(isinstance(row[ind], str) and len(row[ind]) == size
+                       for ind, size in blobs)]
+        self.columns = {}
+        for ind, field in enumerate(fields):
+            values = [row[ind] for row in rows]
+            if field in BLOB_SHAPES:
+                column = numpy.frombuffer(
+                    ''.join(values), dtype='float64').reshape(
+                        (len(values),) + BLOB_SHAPES[field])
+            else:
+                column = numpy.array(values)
+            column.flags.writeable = False
+            self.columns[field] = column
+        self.size = len(rows)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, ind):
+        if not -self.size <= ind < self.size:
+            raise IndexError(ind)
+        return WindowRow(self.columns, ind % self.size)
+
+    def __iter__(self):
+        for ind in range(self.size):
+            yield WindowRow(self.columns, ind)
+
+
+class WindowRow(object):
+    '''A row of a CalibrationWindow. The blobs are given as views of
+    the window matrices, and the other values as python objects.'''
+    __slots__ = ('columns', 'ind')
+
+    def __init__(self, columns, ind):
+        self.columns = columns
+        self.ind = ind
+
+    def __getitem__(self, key):
+        value = self.columns[key][self.ind]
+        if key in BLOB_SHAPES:
+            return value
+        if isinstance(value, (numpy.ndarray, numpy.generic)):
+            return value.tolist()
+        return value
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def keys(self):
+        return self.columns.keys()
+
+
 class PrepareData(object):
     '''prepare level0 database data for calibration'''
 
@@ -30,6 +106,10 @@ class PrepareData(object):
         self.version = version
 
     def get_stw_from_acfile(self):
+        index = get_index(self.con, self.acfile)
+        if index is not None and index['max_stw'] is not None:
+            return index['min_stw'], index['max_stw']
+        # files imported before the index existed
         query_str = "select min(stw),max(stw) from ac_level0 where file='{0}'".format(self.acfile)  # noqa
         query = self.con.query(query_str)
         result = query.dictresult()
@@ -92,7 +172,9 @@ class PrepareData(object):
         return results
 
     def get_data_for_calibration(
-            self, stw1, stw2, tdiff, sodaversion):
+            self, stw1, stw2, tdiff, sodaversion, columnar=False):
+        '''the rows of the calibration window, as a list of dicts or, if
+        columnar, as a CalibrationWindow'''
         temp = [stw1 - tdiff, stw2 + tdiff, sodaversion]
         if self.backend == 'AC1':
             query_str = (
@@ -141,29 +223,80 @@ class PrepareData(object):
         else:
             raise BadBack("Unknown backend {0}".format(self.backend))
 
-        results = query.dictresult()
-        if results == []:
+        if columnar:
+            results = CalibrationWindow(query.listfields(), query.getresult())
+        else:
+            results = query.dictresult()
+        if len(results) == 0:
             raise NoScansError(query_str)
         return results
 
 
-def filter_data(result, start, ssb_att, scanfrontend, tdiff):
-    spectra = []
+def _window_key(frontendsplit, ssb_att):
+    # ssb_att is an array column, which is read as a list
+    if isinstance(ssb_att, list):
+        ssb_att = tuple(ssb_att)
+    return frontendsplit, ssb_att
+
+
+def _window_columns(result, *fields):
+    if isinstance(result, CalibrationWindow):
+        return [result.columns[field].tolist() for field in fields]
+    return [[row[field] for row in result] for field in fields]
+
+
+def window_index(result):
+    '''index of the rows of a calibration window by frontendsplit and
+    ssb_att. For each pair it holds the starts of the rows, in sorted
+    order, and the indices of the rows in result in the same order.'''
+    frontends, ssb_atts, starts = _window_columns(
+        result, 'frontendsplit', 'ssb_att', 'start')
+    groups = {}
+    for ind, key in enumerate(zip(frontends, ssb_atts)):
+        groups.setdefault(_window_key(*key), []).append(ind)
+    index = {}
+    for key, indices in groups.items():
+        indices.sort(key=lambda ind: starts[ind])
+        index[key] = ([starts[ind] for ind in indices], indices)
+    return index
+
+
+def scan_frontends(index, start):
+    '''the frontendsplits of the rows of a scan'''
+    frontends = set()
+    for (frontendsplit, _), (starts, _) in index.items():
+        ind = bisect_left(starts, start)
+        if ind < len(starts) and starts[ind] == start:
+            frontends.add(frontendsplit)
+    return sorted(frontends)
+
+
+def scan_rows(index, start, ssb_att, scanfrontend, tdiff):
+    '''the indices, in increasing order, of the rows with the given
+    frontendsplit and ssb_att that start within tdiff of start'''
+    key = _window_key(scanfrontend, ssb_att)
+    if key not in index:
+        return []
+    starts, indices = index[key]
+    return sorted(indices[bisect_left(starts, start - tdiff):
+                          bisect_right(starts, start + tdiff)])
+
+
+def filter_data(result, start, ssb_att, scanfrontend, tdiff, index=None):
+    '''the indices of the rows of result to use in the calibration of a
+    scan, and the signal type of each of these rows, where the kept
+    calibration spectrum has type CAL. result is not changed, so that
+    it can be filtered for every scan. index is the window_index of
+    result, which is built if it is not given.'''
+    if index is None:
+        index = window_index(result)
+    indices = []
+    sig_types = []
     remove_next_ref = 0
     calspec = 0
     start0 = 0
-    for row in result:
-
-        if row['frontendsplit'] != scanfrontend:
-            continue
-
-        if row['start'] >= start - tdiff and row['start'] <= start + tdiff:
-            pass
-        else:
-            continue
-
-        if row['ssb_att'] != ssb_att:
-            continue
+    for ind in scan_rows(index, start, ssb_att, scanfrontend, tdiff):
+        row = result[ind]
 
         if row['start'] > start0:
             start0 = row['start']
@@ -198,14 +331,16 @@ def filter_data(result, start, ssb_att, scanfrontend, tdiff):
 
         # remove unwished calibration spectrum
         # keep only the second
+        sig_type = row['sig_type']
         if (row['sig_type'] == 'REF' and row['mech_type'] == 'CAL'):
             calspec = calspec + 1
             if calspec == 2:
-                row['sig_type'] = 'CAL'
+                sig_type = 'CAL'
             else:
                 continue
-        spectra.append(row)
-    return spectra
+        indices.append(ind)
+        sig_types.append(sig_type)
+    return indices, sig_types
 
 
 def main():
@@ -0,0 +1,109 @@
+'''
+Correlator configuration of the AC spectrometers.
+
+The mode parameter of an AC spectrum describes how the 8 chips of the
+correlator are cascaded into bands. The mode space is small, so the
+configuration of every possible mode value is precomputed here once and
+shared by the level0 import and the level1a reduction. The tables are
+indexed by mode, which makes it possible to look up the configuration of
+a whole column of modes at once.
+'''
+import numpy
+
+NCHIPS = 8
+NMODES = 256
+LAGSPERCHIP = 96
+CHANNELSPERCHIP = 112
+
+
+def _decode_mode(mode):
+    '''get the ac chip configuration from the mode parameter'''
+    seq = numpy.zeros(16)
+    seq.dtype = int
+    ssb = [1, -1, 1, -1, -1, 1, -1, 1]
+    mode = (mode << 1) | 1
+    for i in range(8):
+        if (mode & 1):
+            m = i
+        seq[2 * m] = seq[2 * m] + 1
+        mode >>= 1
+
+    for i in range(8):
+        if (seq[2 * i]):
+            if (ssb[i] < 0):
+                seq[2 * i + 1] = -1
+            else:
+                seq[2 * i + 1] = 1
+        else:
+            seq[2 * i + 1] = 0
+    chips = []
+    band_start = []
+    band = 0
+    '''chips is a list of vectors'''
+    '''for example chips=[[0], [1, 2, 3, 4], [5, 6, 7]] gives
+       that we observe three bands: the first is
+       from a single chip, for second band chip 1,2,3,4 are cascaded,
+       for third band chip 5,6,7 are cascaded'''
+    for ind, se in enumerate(seq):
+        if ind == band:
+            band_start.append(ind / 2)
+            chips.append(range(ind / 2, ind / 2 + se))
+            band = ind + 2 * se
+    band_start = numpy.array(band_start)
+
+    return seq, chips, band_start
+
+
+def _band_slices(chips, size):
+    '''slices of the bands in a flat array with size values per chip'''
+    return [slice(band[0] * size, (band[0] + len(band)) * size)
+            for band in chips]
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+SEQ = numpy.zeros((NMODES, 16), dtype=int)
+CHIPS = []
+BAND_START = []
+BAND_START_MASK = numpy.zeros((NMODES, NCHIPS), dtype=bool)
+NBANDS = numpy.zeros(NMODES, dtype=int)
+LAG_SLICES = []
+CHANNEL_SLICES = []
+for _mode in range(NMODES):
+    _seq, _chips, _band_start = _decode_mode(_mode)
+    SEQ[_mode] = _seq
+    CHIPS.append(_chips)
+    BAND_START.append(_readonly(_band_start))
+    BAND_START_MASK[_mode, _band_start] = True
+    NBANDS[_mode] = len(_band_start)
+    LAG_SLICES.append(_band_slices(_chips, LAGSPERCHIP))
+    CHANNEL_SLICES.append(_band_slices(_chips, CHANNELSPERCHIP))
+_readonly(SEQ)
+_readonly(BAND_START_MASK)
+_readonly(NBANDS)
+
+
+def get_seq(mode):
+    '''get the ac chip configuration (seq, chips, band_start)
+    from the mode parameter'''
+    mode = int(mode) & 0xff
+    return SEQ[mode], CHIPS[mode], BAND_START[mode]
+
+
+def band_start_mask(modes):
+    '''boolean array of shape modes.shape + (8,) that is true for the
+    chips that start a band in the given modes'''
+    return BAND_START_MASK[numpy.asarray(modes, dtype=int) & 0xff]
+
+
+def lag_slices(mode):
+    '''slices of the bands in the (8 * 96,) cc array of a spectrum'''
+    return LAG_SLICES[int(mode) & 0xff]
+
+
+def channel_slices(mode):
+    '''slices of the bands in the (8 * 112,) level1a spectrum'''
+    return CHANNEL_SLICES[int(mode) & 0xff]
@@ -1,60 +1,59 @@
-from oops.level0 import ACfile, FBAfile, SHKfile, HKdata
+from oops.level0 import ACfile, FBAfile, SHKfile
 from oops import attitude
 
 import numpy
-from pg import ProgrammingError
 from sys import argv
 from os.path import splitext, basename, split
 from datetime import datetime
 import psycopg2
-from StringIO import StringIO
+from odincal.binary_copy import CopyStream, copy_binary, iter_copy
 from odincal.config import config
+from odincal.correlator import band_start_mask
+from odincal.level0_index import (
+    add_blocks, add_rows, insert_index, new_index, write_sidecar)
+from odincal.shk_level0_wide import MERGE as SHK_WIDE_MERGE
 import logging
 
+# column types of the level0 tables for the binary COPY writer
+AC_LEVEL0 = [
+    'int8', 'text', 'text', 'text', 'int4[]', 'int4[]', 'int4', 'float4',
+    'int4', 'bytea', 'bytea', 'text', 'timestamp']
+FBA_LEVEL0 = ['int8', 'text', 'text', 'timestamp']
+ATTITUDE_LEVEL0 = [
+    'int8', 'int4', 'int4', 'int4', 'int4', 'int4', 'int4', 'float8',
+    'float8', 'float8[]', 'float8[]', 'float8[]', 'float8[]', 'float8',
+    'text', 'timestamp']
+SHK_LEVEL0 = ['int8', 'text', 'float4', 'text', 'timestamp']
+# the table of each type of level0 file, its column types and the
+# statement that merges the imported rows of the temporary table foo
+# (the housekeeping rows are also pivoted into shk_level0_wide)
+LEVEL0_TABLES = {
+    '.ac1': ('ac_level0', AC_LEVEL0,
+             "delete from  ac_level0 ac using foo f where f.stw=ac.stw and ac.backend=f.backend;"  # noqa
+             "insert into ac_level0 (select * from foo)"),
+    '.ac2': ('ac_level0', AC_LEVEL0,
+             "delete from  ac_level0 ac using foo f where f.stw=ac.stw and ac.backend=f.backend;"  # noqa
+             "insert into ac_level0 (select * from foo)"),
+    '.fba': ('fba_level0', FBA_LEVEL0,
+             "delete from  fba_level0 fba using foo f where f.stw=fba.stw;"
+             "insert into fba_level0 (select * from foo)"),
+    '.att': ('attitude_level0', ATTITUDE_LEVEL0,
+             "delete from  attitude_level0 att using foo f where f.stw=att.stw;"  # noqa
+             "insert into attitude_level0 (select * from foo)"),
+    '.shk': ('shk_level0', SHK_LEVEL0,
+             "delete from  shk_level0 shk using foo f where f.stw=shk.stw;"
+             "insert into shk_level0 (select * from foo);" + SHK_WIDE_MERGE),
+}
+# number of AC spectra decoded at a time when importing a file
+AC_BATCHSIZE = 256
+
 
 def getSHK(hk):
     """use Ohlbergs code to read in shk data from file
         and creates a dictionary for easy insertation
-        into a postgresdatabase.
+        into a postgresdatabase. The file is decoded in a single pass
+        and every entry holds a pair of (stw, value) numpy arrays.
         """
-    # "first find out dicipline i.e if data is for aero-observations"
-    # discipline=[]
-    # stw=[]
-    # words=hk.getBlock()
-    # while words:
-    #     discipline_def=hk.getIndex()
-    #     stw.extend([discipline_def[0]])
-    #    discipline.extend([discipline_def[2]])
-    #     words=hk.getBlock()
-    # hk.rewind()
-    (STWa, LO495, LO549, STWb, LO555, LO572) = hk.getLOfreqs()
-    (STW, SSB495, SSB549, SSB555, SSB572) = hk.getSSBtunings()
-    shktypes = {
-        "LO495": (STWa, LO495),
-        "LO549": (STWa, LO549),
-        "LO555": (STWb, LO555),
-        "LO572": (STWb, LO572),
-        "SSB495": (STW, SSB495),
-        "SSB549": (STW, SSB549),
-        "SSB555": (STW, SSB555),
-        "SSB572": (STW, SSB572),
-        "mixC495": [],
-        "mixC549": [],
-        "mixC555": [],
-        "mixC572": [],
-        "imageloadA": [],
-        "imageloadB": [],
-        "hotloadA": [],
-        "hotloadB": [],
-        "mixerA": [],
-        "mixerB": [],
-        "lnaA": [],
-        "lnaB": [],
-        "119mixerA": [],
-        "119mixerB": [],
-        "warmifA": [],
-        "warmifB": [],
-    }
     shktypeslist = {
         "mixer current 495": "mixC495",
         "mixer current 549": "mixC549",
@@ -73,14 +72,24 @@ def getSHK(hk):
         "warm IF A-side": "warmifA",
         "warm IF B-side": "warmifB",
     }
+    hkdata, lofreqs, ssbtunings = hk.getSHKdata(shktypeslist.keys())
+    (STWa, LO495, LO549, STWb, LO555, LO572) = lofreqs
+    (STW, SSB495, SSB549, SSB555, SSB572) = ssbtunings
+    shktypes = {
+        "LO495": (STWa, LO495),
+        "LO549": (STWa, LO549),
+        "LO555": (STWb, LO555),
+        "LO572": (STWb, LO572),
+        "SSB495": (STW, SSB495),
+        "SSB549": (STW, SSB549),
+        "SSB555": (STW, SSB555),
+        "SSB572": (STW, SSB572),
+    }
     for shktype in shktypeslist:
-        table = HKdata[shktype]
-        data = hk.getHKword(table[0], sub=table[1])
-        data1 = map(table[2], data[1])
+        stw, data = hkdata[shktype]
         if shktype == "hot load A-side" or shktype == "hot load B-side":
-            data1 = numpy.array(data1) + 273.15
-
-        shktypes[shktypeslist[shktype]] = (data[0], data1)
+            data = data + 273.15
+        shktypes[shktypeslist[shktype]] = (stw, data)
     return shktypes
 
 
@@ -113,75 +122,139 @@ def getAC(ac):
     """AC factory.
     reads a fileobject and creates a dictionary for easy insertation
     into a postgresdatabase. Uses Ohlbergs routines to read the files (ACfile)
+    and decodes the spectrum as getACbatch does.
     """
-    backend = {
-        0x7380: 'AC1',
-        0x73b0: 'AC2',
-    }
-    CLOCKFREQ = 224.0e6
     head = ac.getSpectrumHead()
-    while head is not None:
-        data = []
-        stw = ac.stw
-        back = backend[ac.user]
-        for j in range(12):
-            data.append(ac.getBlock())
-            if data[j] == []:
-                raise EOFError
-        cc = numpy.array(data, dtype='int16')
-        cc.shape = (8, 96)
-        cc64 = numpy.array(cc, dtype='int64')
-        lags = numpy.array(head[50:58], dtype='uint16')
-        lags64 = numpy.array(lags, dtype='int64')
-        # combine lags and data to ensure validity of first value in
-        # cc-channels
-        zlags = numpy.left_shift(lags64, 4) + \
-            numpy.bitwise_and(cc64[:, 0], 0xf)
-        zlags.shape = (8, 1)
-        mode = ac.Mode(head)
-        seq, chips, band_start = get_seq(mode)
-
-        for ind in range(8):
-            if any(ind == band_start):
-                cc64[ind, 0] = zlags[ind, 0]
-                if cc64[ind, 2] > 0:
-                    # find potential underflow in third element of cc
-                    cc64[ind, 2] -= 65536
-        # cc64[:,0]=zlags[:,0]
-        # find potential underflow in third element of cc
-        # mask = cc64[:,2]>0
-        # cc64[mask,2]-=65536
-        # scale
-        if ac.IntTime(head) == 0:
-            IntTime = 9999
-        else:
-            IntTime = ac.IntTime(head)
-        cc64 = cc64 * 2048.0 * (1 / IntTime) / (CLOCKFREQ / 2.0)
-        mon = numpy.array(head[16:32], dtype='uint16')
-        mon.shape = (8, 2)
-        # find potential overflows/underflows in monitor values
-        mon64 = numpy.bitwise_and(zlags, 0xf0000) + mon
-        overflow_mask = numpy.abs(mon64 - zlags) > 0x8000
-        mon64[overflow_mask & (mon64 > zlags)] -= 0x10000
-        mon64[overflow_mask & (mon64 < zlags)] += 0x10000
-        # scale
-        mon64 = mon64 * 1024.0 * (1 / IntTime) / (CLOCKFREQ / 2.0)
-        prescaler = head[49]
-        datadict = {
-            'stw': stw,
-            'backend': back,
-            'frontend': ac.Frontend(head),
-            'sig_type': ac.Type(head),
-            'ssb_att': "{{{0},{1},{2},{3}}}".format(*ac.Attenuation(head)),
-            'ssb_fq': "{{{0},{1},{2},{3}}}".format(*ac.SSBfrequency(head)),
-            'prescaler': prescaler,
-            'inttime': IntTime,
-            'mode': mode,
-            'acd_mon': mon64,
-            'cc': cc64,
-        }
-        return datadict
-    raise EOFError
+    if head is None:
+        raise EOFError
+    block = ac.input.tell() / ac.blocksize - 1
+    for j in range(12):
+        if ac.getBlock() == []:
+            raise EOFError
+    batch = getACbatch(ac, numpy.array([block]))
+    datadict = dict((key, batch[key][0]) for key in (
+        'stw', 'frontend', 'sig_type', 'prescaler', 'inttime', 'mode',
+        'acd_mon', 'cc'))
+    datadict['backend'] = batch['backend']
+    for key in ('ssb_att', 'ssb_fq'):
+        datadict[key] = "{{{0},{1},{2},{3}}}".format(*batch[key][0])
+    return datadict
+
+
+def getACbatch(ac, heads=None):
+    """AC factory.
+    decodes all spectra of a fileobject (or the ones starting at the given
+    head block numbers) at once into a dictionary of arrays with one
+    element per spectrum. The cc and acd_mon arrays have shapes
+    (N, 8, 96) and (N, 8, 2), and the discipline of each spectrum is
+    included (see getACdis).
+    """
+    CLOCKFREQ = 224.0e6
+    blocks = ac.getBlocks()
+    if heads is None:
+        heads = ac.getSpectrumHeads(blocks)
+    head = blocks['words'][heads]
+    data = blocks['words'][heads[:, numpy.newaxis] + numpy.arange(1, 13)]
+    cc64 = numpy.ascontiguousarray(data).view('int16').reshape(-1, 8, 96)
+    cc64 = cc64.astype('int64')
+    lags64 = head[:, 50:58].astype('int64')
+    # combine lags and data to ensure validity of first value in
+    # cc-channels
+    zlags = numpy.left_shift(lags64, 4) + \
+        numpy.bitwise_and(cc64[:, :, 0], 0xf)
+    mode = ac.Modes(head)
+    band_start = band_start_mask(mode)
+    cc64[:, :, 0] = numpy.where(band_start, zlags, cc64[:, :, 0])
+    # find potential underflow in third element of cc
+    underflow = band_start & (cc64[:, :, 2] > 0)
+    cc64[:, :, 2] -= 65536 * underflow
+    # scale
+    inttime = ac.IntTimes(head)
+    inttime[inttime == 0] = 9999
+    scale = (1 / inttime)[:, numpy.newaxis, numpy.newaxis]
+    cc64 = cc64 * 2048.0 * scale / (CLOCKFREQ / 2.0)
+    mon = head[:, 16:32].reshape(-1, 8, 2)
+    zlags = zlags[:, :, numpy.newaxis]
+    # find potential overflows/underflows in monitor values
+    mon64 = numpy.bitwise_and(zlags, 0xf0000) + mon
+    overflow_mask = numpy.abs(mon64 - zlags) > 0x8000
+    mon64[overflow_mask & (mon64 > zlags)] -= 0x10000
+    mon64[overflow_mask & (mon64 < zlags)] += 0x10000
+    # scale
+    mon64 = mon64 * 1024.0 * scale / (CLOCKFREQ / 2.0)
+    index = blocks['index'][heads + 1]
+    discipline = numpy.where(index & 0x4000, 'ASTR', 'AERO')
+    discipline = numpy.where(index & 0x8000, discipline, 'Problem')
+    datadict = {
+        'stw': blocks['stw'][heads].astype('int64'),
+        'backend': ac.type,
+        'frontend': ac.Frontends(head),
+        'sig_type': ac.Types(head),
+        'ssb_att': head[:, 37:41].astype(int),
+        'ssb_fq': head[:, 44:40:-1].astype(int),
+        'prescaler': head[:, 49].astype(int),
+        'inttime': inttime,
+        'mode': mode,
+        'acd_mon': mon64,
+        'cc': cc64,
+        'discipline': discipline,
+    }
+    return datadict
+
+
+def getACheads(ac, blocks=None):
+    """AC factory.
+    finds the heads of the spectra of a fileobject that are imported into
+    the database: aeronomy spectra with a known frontend and integration
+    time. Of spectra with the same stw only the last one is kept.
+    """
+    if blocks is None:
+        blocks = ac.getBlocks()
+    heads = ac.getSpectrumHeads(blocks)
+    words = blocks['words'][heads]
+    inttime = ac.IntTimes(words)
+    index = blocks['index'][heads + 1]
+    valid = (
+        (inttime != 0) & (inttime != 9999) &
+        (index & 0x8000 != 0) & (index & 0x4000 == 0) &
+        numpy.not_equal(ac.Frontends(words), None) &
+        (ac.Types(words) != 'problem'))
+    heads = heads[valid]
+    return heads[last_occurrences(blocks['stw'][heads])]
+
+
+def iter_acbatch(ac, size=AC_BATCHSIZE, heads=None):
+    """AC factory.
+    decodes the spectra of a fileobject (or the ones starting at the given
+    head block numbers) in batches of at most size spectra (see
+    getACbatch), so that the memory used does not depend on the number of
+    spectra in the file.
+    """
+    if heads is None:
+        heads = ac.getSpectrumHeads()
+    for start in range(0, len(heads), size):
+        yield getACbatch(ac, heads[start:start + size])
+
+
+def iter_ac_level0(ac, datafile):
+    """the ac_level0 columns of the spectra of an AC file to import
+    (see getACheads), in batches"""
+    filename = str(split(datafile)[1])
+    for spectra in iter_acbatch(ac, heads=getACheads(ac)):
+        yield (
+            spectra['stw'] + stw_correction(datafile),
+            str(spectra['backend']),
+            spectra['frontend'],
+            spectra['sig_type'],
+            spectra['ssb_att'],
+            spectra['ssb_fq'],
+            spectra['prescaler'],
+            spectra['inttime'],
+            spectra['mode'],
+            spectra['acd_mon'],
+            spectra['cc'],
+            filename,
+            datetime.now())
 
 
 def getFBA(fba):
@@ -203,98 +276,23 @@ def getFBA(fba):
 
 def getATT(file):
     """use Ohlbergs code to read in attitude data from file
-    and creates a dictionary for easy insertation
-    into a postgresdatabase.
+    and creates a dictionary of arrays (one element or row per attitude,
+    sorted by stw) for easy insertation into a postgresdatabase.
     """
-    ap = attitude.AttitudeParser([file])
+    ap = attitude.AttitudeTable([file])
     # sorting attitudes
-    tbl = ap.table
-    keys = tbl.keys()
-    if not keys:
-        return
-    keys.sort()
-    key0 = keys[0]
-    for key1 in keys[1:]:
-        stw0 = tbl[key0][6]
-        stw1 = tbl[key1][6]
-        if stw1 - stw0 < 17:
-            qe0 = tbl[key0][10]
-            qe1 = tbl[key1][10]
-            if qe0 != qe1:
-                err0 = qe0[0] * qe0[0] + qe0[1] * qe0[1] + qe0[2] * qe0[2]
-                err1 = qe1[0] * qe1[0] + qe1[1] * qe1[1] + qe1[2] * qe1[2]
-                # print "errors:", err0, err1
-                if err1 < err0:
-                    del tbl[key0]
-                    key0 = key1
-                else:
-                    del tbl[key1]
-        else:
-            key0 = key1
-
-    datalist = []
-    for key in keys:
-        try:
-            (year, mon, day, hour, minute,
-             secs, stw, orbit, qt, qa, qe, gps, acs) = ap.table[key]
-            datadict = {
-                'year': year,
-                'mon': mon,
-                'day': day,
-                'hour': hour,
-                'min': minute,
-                'secs': secs,
-                'stw': stw,
-                'orbit': orbit,
-                'qt': "{{{0},{1},{2},{3}}}".format(*qt),
-                'qa': "{{{0},{1},{2},{3}}}".format(*qa),
-                'qe': "{{{0},{1},{2}}}".format(*qe),
-                'gps': "{{{0},{1},{2},{3},{4},{5}}}".format(*gps),
-                'acs': acs,
-                'soda': int(ap.soda),
-            }
-            datalist.append(datadict)
-        except BaseException:
-            pass
-    return datalist
-
-
-def get_seq(mode):
-    '''get the ac chip configuration from the mode parameter'''
-    seq = numpy.zeros(16)
-    seq.dtype = int
-    ssb = [1, -1, 1, -1, -1, 1, -1, 1]
-    mode = (mode << 1) | 1
-    for i in range(8):
-        if (mode & 1):
-            m = i
-        seq[2 * m] = seq[2 * m] + 1
-        mode >>= 1
-
-    for i in range(8):
-        if (seq[2 * i]):
-            if (ssb[i] < 0):
-                seq[2 * i + 1] = -1
-            else:
-                seq[2 * i + 1] = 1
-        else:
-            seq[2 * i + 1] = 0
-    chips = []
-    band_start = []
-    band = 0
-    '''chips is a list of vectors'''
-    '''for example chips=[[0], [1, 2, 3, 4], [5, 6, 7]] gives
-       that we observe three bands: the first is
-       from a single chip, for second band chip 1,2,3,4 are cascaded,
-       for third band chip 5,6,7 are cascaded'''
-    for ind, se in enumerate(seq):
-        if ind == band:
-            band_start.append(ind / 2)
-            chips.append(range(ind / 2, ind / 2 + se))
-            band = ind + 2 * se
-    band_start = numpy.array(band_start)
-
-    return seq, chips, band_start
+    datadict = ap.ResolveNeighbours()
+    datadict['soda'] = int(ap.soda)
+    return datadict
+
+
+def last_occurrences(keys):
+    """indices of the last occurrence of every key in the array keys,
+    in the original order"""
+    order = numpy.argsort(keys, kind='mergesort')
+    last = numpy.ones(len(order), dtype=bool)
+    last[:-1] = keys[order][1:] != keys[order][:-1]
+    return numpy.sort(order[last])
 
 
 def stw_correction(datafile):
@@ -303,161 +301,110 @@ def stw_correction(datafile):
     return file_stw & 0xF00000000
 
 
-def import_file(datafile):
+def iter_level0(datafile, index=None):
+    """the columns of the rows to import from a level0 file, in batches
+    (see LEVEL0_TABLES for the tables and their column types). The
+    statistics of the file are filled into the dictionary index, if
+    given (see level0_index)."""
     extension = splitext(datafile)[1]
-    fgr = StringIO()
-    logger = logging.getLogger('level0.process')
-    logger.info('importing file {0}'.format(datafile))
+    filename = str(split(datafile)[1])
+    if index is None:
+        index = {}
+    index.update(new_index(datafile, extension[1:].upper()))
     if extension == '.ac1' or extension == '.ac2':
         f = ACfile(datafile)
-        f2 = ACfile(datafile)
-        while True:
-            try:
-                datadict = getAC(f)
-                discipline = getACdis(f2)
-                datadict['stw'] += stw_correction(datafile)
-                if (datadict['inttime'] != 9999 and discipline == 'AERO' and
-                    datadict['frontend'] is not None and
-                        datadict['sig_type'] != 'problem'):
-                    # create an import file to dump in data into
-                    fgr.write(
-                        str(datadict['stw']) + '\t' +
-                        str(datadict['backend']) + '\t' +
-                        str(datadict['frontend']) + '\t' +
-                        str(datadict['sig_type']) + '\t' +
-                        str(datadict['ssb_att']) + '\t' +
-                        str(datadict['ssb_fq']) + '\t' +
-                        str(datadict['prescaler']) + '\t' +
-                        str(datadict['inttime']) + '\t' +
-                        str(datadict['mode']) + '\t' +
-                        '\\\\x' + datadict['acd_mon'].tostring().encode('hex') + '\t' +  # noqa
-                        '\\\\x' + datadict['cc'].tostring().encode('hex') + '\t' +  # noqa
-                        str(split(datafile)[1]) + '\t' +
-                        str(datetime.now()) + '\n')
-            except EOFError:
-                break
-            except ProgrammingError:
-                continue
-        conn = psycopg2.connect(config.get('database', 'pgstring'))
-        cur = conn.cursor()
-        fgr.seek(0)
-        cur.execute("create temporary table foo ( like ac_level0 );")
-        cur.copy_from(file=fgr, table='foo')
-        cur.execute(
-            "select stw,count(*) from foo group by stw having count(*)>1")
-        cur2 = conn.cursor()
-        for r in cur:
-            print r
-            cur2.execute('''delete from foo where stw={0} and created=any(array(select created from foo where stw={0} limit {1}))'''.format(*[r[0], r[1] - 1]))  # noqa
-        cur2.close()
-        fgr.close()
-        cur.execute(
-            "delete from  ac_level0 ac using foo f where f.stw=ac.stw and ac.backend=f.backend")  # noqa
-        cur.execute("insert into ac_level0 (select * from foo)")
-        conn.commit()
-        conn.close()
+        blocks = f.getBlocks()
+        heads = f.getSpectrumHeads(blocks)
+        add_blocks(
+            index, blocks['stw'].astype('int64') + stw_correction(datafile),
+            blocks['index'][heads + 1])
+        # decode the file in batches
+        for columns in iter_ac_level0(f, datafile):
+            add_rows(index, columns[0])
+            yield columns
 
     elif extension == '.fba':
         f = FBAfile(datafile)
-        while True:
-            try:
-                datadict = getFBA(f)
-                datadict['stw'] += stw_correction(datafile)
-                # create an import file to dump in data into db
-                fgr.write(
-                    str(datadict['stw']) + '\t' +
-                    str(datadict['mech_type']) + '\t' +
-                    str(split(datafile)[1]) + '\t' +
-                    str(datetime.now()) + '\n')
-            except EOFError:
-                break
-            except ProgrammingError:
-                continue
-
-        conn = psycopg2.connect(config.get('database', 'pgstring'))
-        cur = conn.cursor()
-        fgr.seek(0)
-        cur.execute("create temporary table foo ( like fba_level0 );")
-        cur.copy_from(file=fgr, table='foo')
-        cur.execute(
-            "select stw,count(*) from foo group by stw having count(*)>1")
-        cur2 = conn.cursor()
-        for r in cur:
-            print r
-            cur2.execute('''delete from foo where stw={0} and
-                        created=any(array(select created from foo where stw={0} limit {1}))'''.format(*[r[0], r[1] - 1]))  # noqa
-        cur2.close()
-        fgr.close()
-        cur.execute(
-            "delete from  fba_level0 fba using foo f where f.stw=fba.stw")
-        cur.execute("insert into fba_level0 (select * from foo)")
-        conn.commit()
-        conn.close()
+        blocks = f.getBlocks()
+        add_blocks(
+            index, blocks['stw'].astype('int64') + stw_correction(datafile),
+            blocks['index'])
+        # read all spectrum heads of the file in one go
+        heads = f.getSpectrumHeads()
+        heads = heads[last_occurrences(heads['stw'])]
+        stws = heads['stw'].astype('int64') + stw_correction(datafile)
+        mech_types = f.Types(heads['words'])
+        add_rows(index, stws)
+        yield stws, mech_types, filename, datetime.now()
 
     elif extension == '.att':
-        datalist = getATT(datafile)
-        for datadict in datalist:
-            fgr.write(str(datadict['stw']) + '\t' +
-                      str(datadict['soda']) + '\t' +
-                      str(datadict['year']) + '\t' +
-                      str(datadict['mon']) + '\t' +
-                      str(datadict['day']) + '\t' +
-                      str(datadict['hour']) + '\t' +
-                      str(datadict['min']) + '\t' +
-                      str(datadict['secs']) + '\t' +
-                      str(datadict['orbit']) + '\t' +
-                      str(datadict['qt']) + '\t' +
-                      str(datadict['qa']) + '\t' +
-                      str(datadict['qe']) + '\t' +
-                      str(datadict['gps']) + '\t' +
-                      str(datadict['acs']) + '\t' +
-                      str(split(datafile)[1]) + '\t' +
-                      str(datetime.now()) + '\n')
-
-        conn = psycopg2.connect(config.get('database', 'pgstring'))
-        cur = conn.cursor()
-        fgr.seek(0)
-        cur.execute("create temporary table foo ( like attitude_level0 );")
-        cur.copy_from(file=fgr, table='foo')
-        fgr.close()
-        cur.execute(
-            "delete from  attitude_level0 att using foo f where f.stw=att.stw")
-        cur.execute("insert into attitude_level0 (select * from foo)")
-        conn.commit()
-        conn.close()
+        datadict = getATT(datafile)
+        add_rows(index, datadict['stw'])
+        index['first_stw'] = index['min_stw']
+        index['last_stw'] = index['max_stw']
+        yield (
+            datadict['stw'],
+            datadict['soda'],
+            datadict['year'],
+            datadict['mon'],
+            datadict['day'],
+            datadict['hour'],
+            datadict['min'],
+            datadict['secs'],
+            datadict['orbit'],
+            datadict['qt'],
+            datadict['qa'],
+            datadict['qe'],
+            datadict['gps'],
+            datadict['acs'],
+            filename,
+            datetime.now())
 
     elif extension == '.shk':
         hk = SHKfile(datafile)
+        blocks = hk.getBlocks()
+        add_blocks(
+            index, blocks['stw'].astype('int64') + stw_correction(datafile),
+            blocks['index'])
         datadict = getSHK(hk)
         for data in datadict:
-            for index, stw in enumerate(datadict[data][0]):
-                stw += stw_correction(datafile)
-                fgr.write(str(stw) + '\t' +
-                          str(data) + '\t' +
-                          str(float(datadict[data][1][index])) + '\t' +
-                          str(split(datafile)[1]) + '\t' +
-                          str(datetime.now()) + '\n')
-
-        conn = psycopg2.connect(config.get('database', 'pgstring'))
-        cur = conn.cursor()
-        fgr.seek(0)
-        cur.execute("create temporary table foo ( like shk_level0 );")
-        cur.copy_from(file=fgr, table='foo')
-        cur.execute(
-            "select stw,shk_type,count(*) from foo group by stw,shk_type having count(*)>1")  # noqa
-        cur2 = conn.cursor()
-        for r in cur:
-            print r
-            cur2.execute('''delete from foo where stw={0} and shk_type='{1}' and
-                        created=any(array(select created from foo where stw={0} and shk_type='{1}' limit {2}))'''.format(*[r[0], r[1], r[2] - 1]))  # noqa
-        cur2.close()
-        fgr.close()
-        cur.execute("delete from  shk_level0 shk using foo f where f.stw=shk.stw")  # noqa
-        cur.execute("insert into shk_level0 (select * from foo)")
-        conn.commit()
-        conn.close()
-    else:
-        pass
+            stw, value = datadict[data]
+            last = last_occurrences(stw)
+            stw = stw[last].astype('int64') + stw_correction(datafile)
+            add_rows(index, stw)
+            yield stw, str(data), value[last], filename, datetime.now()
+
+
+def upload_file(conn, datafile, data, index=None):
+    """copy the rows of a level0 file, as data in the binary COPY format
+    (see iter_level0), into the database together with the index of the
+    file, if given, and commit them"""
+    table, types, merge = LEVEL0_TABLES[splitext(datafile)[1]]
+    cur = conn.cursor()
+    cur.execute(
+        "create temporary table foo ( like {0} ) on commit drop;".format(
+            table))
+    copy_binary(cur, 'foo', data)
+    cur.execute(merge)
+    if index is not None:
+        insert_index(cur, index)
+    conn.commit()
+    cur.close()
+
+
+def import_file(datafile):
+    extension = splitext(datafile)[1]
+    logger = logging.getLogger('level0.process')
+    logger.info('importing file {0}'.format(datafile))
+    if extension not in LEVEL0_TABLES:
+        return
+    conn = psycopg2.connect(config.get('database', 'pgstring'))
+    # the file is decoded while the data is uploaded
+    index = {}
+    upload_file(conn, datafile, CopyStream(iter_copy(
+        LEVEL0_TABLES[extension][1], iter_level0(datafile, index))), index)
+    conn.close()
+    write_sidecar(datafile, index)
 
 
 def level0data2db():
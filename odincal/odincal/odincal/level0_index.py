@@ -0,0 +1,108 @@
+"""Index of the imported level0 files.
+
+The index of a level0 file is filled when the file is imported, and holds
+the file type, the exact first and last stw of the file, the number of
+blocks, the number of blocks (spectra for AC files) per discipline, and
+the number and stw range of the rows imported from the file. It is
+stored in the level0_file_index table and in a sidecar file next to the
+level0 file, so that the files covering an stw can be found without
+reading the level0 files or scanning the level0 tables.
+"""
+from os.path import basename, getmtime
+import json
+import logging
+
+logger = logging.getLogger('level0.index')
+
+SIDECAR = '.index.json'
+
+COLUMNS = (
+    'file', 'file_type', 'first_stw', 'last_stw', 'blocks', 'aero', 'astr',
+    'problem', 'nrows', 'min_stw', 'max_stw')
+
+
+def new_index(datafile, file_type):
+    """an empty index of a level0 file"""
+    index = dict.fromkeys(COLUMNS)
+    index['file'] = basename(datafile)
+    index['file_type'] = file_type
+    index['nrows'] = 0
+    return index
+
+
+def add_blocks(index, stws, disciplines=None):
+    """add the stws of the blocks of a file to the index, and optionally
+    the index words that give the discipline of the blocks or spectra"""
+    index['blocks'] = len(stws)
+    if len(stws):
+        index['first_stw'] = int(stws.min())
+        index['last_stw'] = int(stws.max())
+    if disciplines is not None:
+        valid = (disciplines & 0x8000) != 0
+        astr = (disciplines & 0x4000) != 0
+        index['aero'] = int((valid & ~astr).sum())
+        index['astr'] = int((valid & astr).sum())
+        index['problem'] = int((~valid).sum())
+
+
+def add_rows(index, stws):
+    """add the stws of a batch of imported rows to the index"""
+    if not len(stws):
+        return
+    index['nrows'] += len(stws)
+    low, high = int(stws.min()), int(stws.max())
+    if index['min_stw'] is None or low < index['min_stw']:
+        index['min_stw'] = low
+    if index['max_stw'] is None or high > index['max_stw']:
+        index['max_stw'] = high
+
+
+def write_sidecar(datafile, index):
+    """write the index next to the level0 file, if possible"""
+    try:
+        with open(datafile + SIDECAR, 'w') as sidecar:
+            json.dump(index, sidecar, sort_keys=True)
+    except (IOError, OSError) as error:
+        logger.debug('could not write index of %s: %s', datafile, error)
+
+
+def read_sidecar(datafile):
+    """the index of a level0 file from its sidecar, or None if there is
+    no sidecar or it is older than the file"""
+    try:
+        if getmtime(datafile + SIDECAR) < getmtime(datafile):
+            return None
+        with open(datafile + SIDECAR) as sidecar:
+            return json.load(sidecar)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def insert_index(cur, index):
+    """insert (or replace) the index of a file in level0_file_index"""
+    cur.execute(
+        "delete from level0_file_index where file=%(file)s;"
+        "insert into level0_file_index ({0}) values ({1})".format(
+            ','.join(COLUMNS),
+            ','.join('%({0})s'.format(column) for column in COLUMNS)),
+        index)
+
+
+def get_index(con, filename):
+    """the index of a level0 file from the database, or None"""
+    result = con.query(
+        "select {0} from level0_file_index where file='{1}'".format(
+            ','.join(COLUMNS), basename(filename))).dictresult()
+    if not result:
+        return None
+    return result[0]
+
+
+def files_covering(con, stw, file_type=None):
+    """the level0 files that cover an stw"""
+    query = '''select file from level0_file_index
+               where first_stw<={0} and last_stw>={0}'''.format(int(stw))
+    if file_type is not None:
+        query += " and file_type='{0}'".format(file_type)
+    result = con.query(query + ' order by first_stw').dictresult()
+    return [row['file'] for row in result]
@@ -0,0 +1,152 @@
+"""Parallel import of level0 files.
+
+The files are imported in a pool of processes, where every process
+decodes its file into the binary COPY format while it streams the data
+into the database, so that at most a few chunks of a file are held in
+memory by each process. The processes share a limited number of
+database connections: a process that waits for a connection has
+decoded the first chunks of its file. Attitude, housekeeping and fba
+files are imported before the AC files, since the processing of the AC
+data needs them.
+"""
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from multiprocessing import Pool, Semaphore, cpu_count
+from os import listdir
+from os.path import basename, getsize, isdir, join, splitext
+from time import time
+import logging
+
+import psycopg2
+
+from odincal.binary_copy import CopyStream, iter_copy
+from odincal.config import config
+from odincal.level0 import LEVEL0_TABLES, iter_level0, upload_file
+from odincal.level0_index import write_sidecar
+
+logger = logging.getLogger('level0.parallel')
+
+# the files of a stage are imported after all files of the previous stages
+STAGES = [('.att', '.shk', '.fba'), ('.ac1', '.ac2')]
+
+# the default number of database connections shared by the processes
+CONNECTIONS = 4
+
+# the semaphore of the connections of a process in the pool
+_connections = None
+
+
+def get_stages(paths):
+    """sort the level0 files of paths (files or directories) into the
+    import stages"""
+    files = []
+    for path in paths:
+        if isdir(path):
+            files.extend(sorted(join(path, name) for name in listdir(path)))
+        else:
+            files.append(path)
+    return [[datafile for datafile in files
+             if splitext(datafile)[1] in extensions]
+            for extensions in STAGES]
+
+
+def init_process(connections):
+    """share the semaphore of the database connections with a process
+    of the pool"""
+    global _connections
+    _connections = connections
+
+
+@contextmanager
+def connection_slot():
+    """wait for one of the database connections shared by the processes"""
+    if _connections is None:
+        yield
+        return
+    _connections.acquire()
+    try:
+        yield
+    finally:
+        _connections.release()
+
+
+def timed(chunks, seconds):
+    """the chunks, adding the time spent producing them to seconds[0]"""
+    start = time()
+    for chunk in chunks:
+        seconds[0] += time() - start
+        yield chunk
+        start = time()
+    seconds[0] += time() - start
+
+
+def import_file(datafile):
+    """decode a level0 file and stream it into the database on one of
+    the shared connections, returns whether the file was imported"""
+    index = {}
+    decoding = [0.0]
+    data = CopyStream(timed(iter_copy(
+        LEVEL0_TABLES[splitext(datafile)[1]][1],
+        iter_level0(datafile, index)), decoding))
+    try:
+        with connection_slot():
+            start = time()
+            try:
+                conn = psycopg2.connect(config.get('database', 'pgstring'))
+            except Exception:
+                logger.exception('failed to connect for file %s', datafile)
+                return False
+            try:
+                upload_file(conn, datafile, data, index)
+            except Exception:
+                conn.rollback()
+                logger.exception('failed to import file %s', datafile)
+                return False
+            finally:
+                conn.close()
+            uploading = time() - start
+    finally:
+        data.close()
+    write_sidecar(datafile, index)
+    logger.info(
+        '%s: %.1f MB decoded in %.2f s and uploaded in %.2f s',
+        basename(datafile), getsize(datafile) / 1e6, decoding[0],
+        uploading)
+    return True
+
+
+def import_files(paths, processes=None, connections=CONNECTIONS):
+    """import the level0 files of paths in processes sharing at most
+    connections database connections, returns the number of failed
+    files"""
+    pool = Pool(processes or cpu_count(), init_process,
+                (Semaphore(connections),))
+    failed = 0
+    try:
+        for files in get_stages(paths):
+            failed += sum(
+                not imported
+                for imported in pool.imap_unordered(import_file, files))
+    finally:
+        pool.terminate()
+    return failed
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        'paths', nargs='+', help='level0 files or directories with files')
+    parser.add_argument(
+        '--processes', type=int, default=None,
+        help='number of decoding processes (default: number of cpus)')
+    parser.add_argument(
+        '--connections', type=int, default=CONNECTIONS,
+        help='number of database connections shared by the processes '
+        '(default: %(default)s)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    failed = import_files(args.paths, args.processes, args.connections)
+    if failed:
+        logger.error('%i files failed to import', failed)
+        return 1
+    return 0
@@ -0,0 +1,123 @@
+"""Spectral transform of the level1a reduction.
+
+The corrected lags of a band of the AC spectrometers are turned into a
+spectrum of 112 channels per chip by a Hanning weighted Fourier transform
+of the even sequence of the lags. Two backends are available:
+
+    odinfft  the transform of the odin library, in libfft.so
+    numpy    the same transform with numpy.fft
+
+The backend is chosen with the ODINCAL_FFT environment variable, or
+with the fft option of the level1a section of the configuration. The
+backends can be compared with
+
+    python -m odincal.level1a_fft --spectra 1000
+"""
+from argparse import ArgumentParser
+from math import pi
+from time import time
+import ctypes
+import logging
+import os
+
+from pkg_resources import resource_filename
+import numpy
+
+from odincal.config import config
+
+logger = logging.getLogger("odincal.level1a_fft")
+
+# the fft library, see get_libfft
+_libfft = None
+
+
+def get_libfft():
+    """the fft library, which is loaded on first use"""
+    global _libfft
+    if _libfft is None:
+        librarypath = resource_filename('oops', 'libfft.so')
+        logger.debug("loading fft.so {%s}", librarypath)
+        _libfft = ctypes.CDLL(librarypath, mode=3)
+        _libfft.odinfft_batch.argtypes = [
+            ctypes.POINTER(ctypes.c_double), ctypes.c_int, ctypes.c_int]
+        _libfft.odinfft_batch.restype = None
+    return _libfft
+
+
+def odinfft(data):
+    """transform an (N, n) array of corrected lags into spectra with
+    odinfft, n is 112 times the number of chips of the bands"""
+    data = numpy.array(data, dtype='float64', order='C', ndmin=2)
+    nspectra, nlags = data.shape
+    if nspectra:
+        get_libfft().odinfft_batch(
+            data.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+            nlags, nspectra)
+        logger.debug("executed libfft.so successfully")
+    return data
+
+
+def numpy_fft(data):
+    """transform an (N, n) array of corrected lags into spectra with
+    numpy, the result is the same as the one of odinfft"""
+    data = numpy.array(data, dtype='float64', ndmin=2)
+    nspectra, nlags = data.shape
+    data *= 0.5 + 0.5 * numpy.cos(pi / nlags * numpy.arange(nlags))
+    # the even sequence data[0] ... data[n-1] 0.0 data[n-1] ... data[1]
+    even = numpy.zeros((nspectra, 2 * nlags))
+    even[:, :nlags] = data
+    even[:, nlags + 1:] = data[:, :0:-1]
+    return numpy.fft.rfft(even, axis=1)[:, :nlags].real
+
+
+FFT_BACKENDS = {
+    'odinfft': odinfft,
+    'numpy': numpy_fft,
+}
+
+
+def get_fft(backend=None):
+    """the fft backend with the given name, or the configured one"""
+    if backend is None:
+        backend = os.environ.get('ODINCAL_FFT', config.get('level1a', 'fft'))
+    try:
+        return FFT_BACKENDS[backend]
+    except KeyError:
+        raise ValueError('unknown fft backend {0!r}, use one of {1}'.format(
+            backend, ', '.join(sorted(FFT_BACKENDS))))
+
+
+def benchmark(backend, nspectra=1000, nchips=1, repeat=3):
+    """the number of bands per second transformed by a backend, the best
+    of repeat transforms of nspectra random bands of nchips chips"""
+    fft = get_fft(backend)
+    data = numpy.random.uniform(-0.1, 0.1, (nspectra, nchips * 112))
+    best = None
+    for _ in range(repeat):
+        start = time()
+        fft(data)
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return nspectra / max(best, 1e-9)
+
+
+def main():
+    parser = ArgumentParser(
+        description='compare the throughput of the level1a fft backends')
+    parser.add_argument(
+        '--spectra', type=int, default=1000,
+        help='number of bands per transform (default: 1000)')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='number of transforms, the best is used (default: 3)')
+    args = parser.parse_args()
+    for nchips in (1, 2, 4, 8):
+        for backend in sorted(FFT_BACKENDS):
+            print '{0:8s} {1} chips: {2:10.0f} bands/s'.format(
+                backend, nchips,
+                benchmark(backend, args.spectra, nchips, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,8 @@ import logging
 import numpy
 from pg import DB
 from oops import odin  # pylint: disable=import-error
-from odincal.calibration_preprocess import PrepareData, filter_data, NoScansError
+from odincal.calibration_preprocess import (
+    PrepareData, filter_data, NoScansError, scan_frontends, window_index)
 from odincal.database import ConfiguredDatabase
 from odincal.frequency_calibration import Spectra
 from odincal.intensity_calibration import calibrate
@@ -13,37 +14,56 @@ from odincal.intensity_calibration import calibrate
 TDIFF = 45 * 60 * 16
 
 
-def frequency_calibrate(listof_uncal_spec, con):
-    '''use the object Spectra to perform a frequency calibration'''
+def frequency_calibrate_row(row, con):
+    '''use the object Spectra to perform a frequency calibration of a
+       row, returns None if the spectrum can not be calibrated'''
+    spec = Spectra(con, row, 0)
+    # if spec.lofreq < 1:
+    #     continue
+
+    if spec.frontend == 'SPL':
+        # split data into two spectra
+        spectrum = odin.Spectrum()
+        spectrum.backend = spec.backend
+        spectrum.channels = len(spec.data)
+        spectrum.data = spec.data
+        spectrum.lofreq = spec.lofreq
+        spectrum.intmode = spec.intmode
+        spectrum.frontend = spec.frontend
+        (spec1, spec2) = spectrum.Split()
+        if spec1.frontend == row['frontendsplit']:
+            spec.data = spec1.data
+            spec.intmode = spec1.intmode
+            spec.frontend = spec1.frontend
+        if spec2.frontend == row['frontendsplit']:
+            spec.data = spec2.data
+            spec.intmode = spec2.intmode
+            spec.frontend = spec2.frontend
+
+    spec.tuning()
+    if spec.lofreq < 1:
+        return None
+    spec.get_freqmode()
+    return spec
+
+
+def frequency_calibrate(listof_uncal_spec, sig_types, con, cache=None):
+    '''frequency calibrate the rows, with the given signal types.
+       cache holds the spectra calibrated so far by (stw, backend,
+       frontendsplit), so that a row in the windows of several scans
+       of a file is calibrated once. The intensity calibration changes
+       the spectra, so every call gets deep copies of them.'''
+    if cache is None:
+        cache = {}
     listofspec = []
-    for row in listof_uncal_spec:
-        spec = Spectra(con, row, 0)
-        # if spec.lofreq < 1:
-        #     continue
-
-        if spec.frontend == 'SPL':
-            # split data into two spectra
-            spectrum = odin.Spectrum()
-            spectrum.backend = spec.backend
-            spectrum.channels = len(spec.data)
-            spectrum.data = spec.data
-            spectrum.lofreq = spec.lofreq
-            spectrum.intmode = spec.intmode
-            spectrum.frontend = spec.frontend
-            (spec1, spec2) = spectrum.Split()
-            if spec1.frontend == row['frontendsplit']:
-                spec.data = spec1.data
-                spec.intmode = spec1.intmode
-                spec.frontend = spec1.frontend
-            if spec2.frontend == row['frontendsplit']:
-                spec.data = spec2.data
-                spec.intmode = spec2.intmode
-                spec.frontend = spec2.frontend
-
-        spec.tuning()
-        if spec.lofreq < 1:
+    for row, sig_type in zip(listof_uncal_spec, sig_types):
+        key = (row['stw'], row['backend'], row['frontendsplit'])
+        if key not in cache:
+            cache[key] = frequency_calibrate_row(row, con)
+        if cache[key] is None:
             continue
-        spec.get_freqmode()
+        spec = copy.deepcopy(cache[key])
+        spec.type = sig_type
         listofspec.append(spec)
 
     return listofspec
@@ -400,7 +420,7 @@ def import_level1b(
             "Will now get data from {0} to {1}".format(firstscan, lastscan)
         )
         result = prepare_data.get_data_for_calibration(
-            firstscan, lastscan, TDIFF, sodaversion,
+            firstscan, lastscan, TDIFF, sodaversion, columnar=True,
         )
     except NoScansError as err:
         info = {
@@ -414,40 +434,39 @@ def import_level1b(
         report_result(con, acfile, info)
         raise Level1BPrepareDataError(msg)
     logger.debug("Got {0} data rows".format(len(result)))
+    index = window_index(result)
+    calibrated_spectra = {}
 
     # now loop over the scans
     success_scans = 0
     scan_ids = []
     for row in scanstarts:
         # find out which frontend(s) we have in the scan
-        scanfrontends = []
-        for datarow in result:
-            if datarow['start'] == row['start']:
-                scanfrontends.append(datarow['frontendsplit'])
-        scanfrontends = numpy.array(scanfrontends)
-        scanfrontends = numpy.unique(scanfrontends)
-
-        resultfresh = copy.deepcopy(result)
+        scanfrontends = scan_frontends(index, row['start'])
+
         for scanfrontend in scanfrontends:
             # filter data i.e remove undesired references
-            scandata = filter_data(
-                resultfresh,
+            indices, sig_types = filter_data(
+                result,
                 row['start'],
                 row['ssb_att'],
                 scanfrontend,
                 TDIFF,
+                index,
             )
             logger.debug(
                 "{0} scans remain for {1} after filter".format(
-                    len(scandata),
+                    len(indices),
                     scanfrontend,
                 )
             )
             # now we are ready to start to calibrate
             # spectra for a scan
-            if scandata == []:
+            if indices == []:
                 continue
-            listofspec = frequency_calibrate(scandata, con)
+            scandata = [result[ind] for ind in indices]
+            listofspec = frequency_calibrate(
+                scandata, sig_types, con, calibrated_spectra)
             logger.debug(
                 "frequency calibration complete for {0}".format(scanfrontend)
             )
@@ -0,0 +1,58 @@
+"""Wide storage of the level0 housekeeping data.
+
+shk_level0 holds one row per stw and shk type. shk_level0_wide holds the
+same data with one row per stw and one column per shk type, where a type
+that was not sampled at the stw is null. It is filled when a housekeeping
+file is imported, by pivoting the rows of the file, and is what the level1
+housekeeping matching and the coverage check of AC files read.
+"""
+from pandas import DataFrame
+
+# the shk types and their columns in shk_level0_wide
+SHK_CHANNELS = [
+    ('LO495', 'lo495'), ('LO549', 'lo549'), ('LO555', 'lo555'),
+    ('LO572', 'lo572'), ('SSB495', 'ssb495'), ('SSB549', 'ssb549'),
+    ('SSB555', 'ssb555'), ('SSB572', 'ssb572'), ('mixC495', 'mixc495'),
+    ('mixC549', 'mixc549'), ('mixC555', 'mixc555'), ('mixC572', 'mixc572'),
+    ('imageloadA', 'imageloada'), ('imageloadB', 'imageloadb'),
+    ('hotloadA', 'hotloada'), ('hotloadB', 'hotloadb'),
+    ('mixerA', 'mixera'), ('mixerB', 'mixerb'), ('lnaA', 'lnaa'),
+    ('lnaB', 'lnab'), ('119mixerA', 'mixer119a'), ('119mixerB', 'mixer119b'),
+    ('warmifA', 'warmifa'), ('warmifB', 'warmifb')]
+
+COLUMNS = [column for _, column in SHK_CHANNELS]
+
+
+def select_wide(source):
+    """a query that pivots the shk_level0 rows of source into the rows of
+    shk_level0_wide"""
+    return 'select stw,max(file),{0} from {1} group by stw'.format(
+        ','.join("max(shk_value) filter (where shk_type='{0}')".format(
+            shk_type) for shk_type, _ in SHK_CHANNELS),
+        source)
+
+
+INSERT = 'insert into shk_level0_wide (stw,file,{0}) '.format(
+    ','.join(COLUMNS))
+
+# merges the rows of an imported file, in the temporary table foo
+MERGE = (
+    'delete from shk_level0_wide w using foo f where f.stw=w.stw;' +
+    INSERT + select_wide('foo'))
+
+# fills shk_level0_wide with the data imported before it existed
+BACKFILL = (
+    INSERT + select_wide('shk_level0') + ' on conflict (stw) do nothing')
+
+
+def get_shk_wide(con, stwa, stwb):
+    """the housekeeping data between stwa and stwb as a frame indexed by
+    stw, with one column per shk type"""
+    rows = con.query(
+        'select stw,{0} from shk_level0_wide '
+        'where stw between $1 and $2 order by stw'.format(','.join(COLUMNS)),
+        (stwa, stwb)).dictresult()
+    shk = DataFrame.from_records(
+        rows, columns=['stw'] + COLUMNS).set_index('stw')
+    return shk.rename(
+        columns=dict((column, shk_type) for shk_type, column in SHK_CHANNELS))
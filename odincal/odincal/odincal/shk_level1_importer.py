@@ -1,25 +1,58 @@
 from datetime import datetime
 from pg import DB
-from pandas import DataFrame
+from pandas import DataFrame, merge_asof
 import logging
+import numpy
+import psycopg2
+from odincal.binary_copy import BinaryCopy
+from odincal.bulk_upsert import bulk_upsert
+from odincal.config import config
+from odincal.database import ConfiguredDatabase
+from odincal.shk_level0_wide import get_shk_wide
 
 logger = logging.getLogger("odincal.skh_level1_importer")
 
+# column types of shk_level1 for the binary COPY writer
+SHK_LEVEL1 = ['int8', 'text', 'text'] + ['float4'] * 15 + ['timestamp']
 
-def find_nearest(df, stw):
-    index = df.index.searchsorted(stw)
-    try:
-        data = df.iloc[index]
-    except IndexError:
-        return None
-    real_stw = data.name
-    if (real_stw > stw + 2080) or (real_stw < stw - 2080):
-        return None
-    return data.shk_value
+# the shk_level1 columns between frontendsplit and created
+SHK_COLUMNS = [
+    'lo', 'ssb', 'mixc', 'imageloada', 'imageloadb', 'hotloada', 'hotloadb',
+    'mixera', 'mixerb', 'lnaa', 'lnab', 'mixer119a', 'mixer119b', 'warmifa',
+    'warmifb']
 
 
-def shk_level1_importer(stwa, stwb, backend, pg_string):
-    con = DB(pg_string)
+# the largest distance in stw between a spectrum and its housekeeping data
+TOLERANCE = 2080
+
+
+def match_shk(stws, shk):
+    """match every stw with the first value of each shk type at or after
+    it, within TOLERANCE. shk is a frame indexed by stw with one column
+    per shk type (see get_shk_wide), where types that were not sampled
+    are null. Returns a frame indexed by stw with one column per shk type
+    in shk, where unmatched values are nan."""
+    spectra = DataFrame({"stw": numpy.unique(numpy.asarray(stws, "int64"))})
+    wide = DataFrame(index=spectra["stw"])
+    for shk_type in shk.columns:
+        values = shk[shk_type].dropna()
+        if values.empty:
+            continue
+        group = DataFrame({
+            "stw": values.index.values.astype("int64"),
+            "shk_value": values.values.astype(float)})
+        matched = merge_asof(
+            spectra, group, on="stw", direction="forward",
+            tolerance=TOLERANCE, allow_exact_matches=True)
+        wide[shk_type] = matched["shk_value"].values
+    return wide
+
+
+def shk_level1_importer(stwa, stwb, backend, pg_string=None):
+    if pg_string is None:
+        con = ConfiguredDatabase()
+    else:
+        con = DB(pg_string)
     query = con.query(
         """\
         select stw,backend,frontend from ac_level0
@@ -30,21 +63,15 @@ def shk_level1_importer(stwa, stwb, backend, pg_string):
 
     sigresult = query.dictresult()
     logger.debug("Got %i spectrum to import [%i,%i]", len(sigresult), stwa, stwb)
-    query = con.query(
-        """\
-        select stw,shk_type,shk_value from shk_level0
-        where stw between $1 and $2
-        order by stw""",
-        (stwa - 2080, stwb + 2080),
-    )
-    shk_rows = query.dictresult()
-    logger.debug("Got %i SHK-rows for STW [%i,%i]", len(shk_rows), stwa, stwb)
-    df = DataFrame.from_dict(shk_rows).set_index("stw")
-    gr = df.groupby("shk_type")
-    table_data = []
+    shk = get_shk_wide(con, stwa - TOLERANCE, stwb + TOLERANCE)
+    logger.debug("Got %i SHK-rows for STW [%i,%i]", len(shk), stwa, stwb)
     logger.debug("starting matching process")
+    wide = match_shk([sig["stw"] for sig in sigresult], shk)
+    # spectra without any housekeeping data in range get the defaults
+    matched = wide[wide.notnull().any(axis=1)].to_dict("index")
+    table_data = []
     for sig in sigresult:
-        data = gr.apply(find_nearest, sig["stw"])
+        data = matched.get(sig["stw"], {})
         # For the split modes and the currently accepted
         # frontend configurations, AC1 will hold REC_495 data in its lower half
         # and REC_549 in its upper half. AC2 will hold REC_572 data in its
@@ -73,21 +100,33 @@ def shk_level1_importer(stwa, stwb, backend, pg_string):
                 "mixer119b": data.get("119mixerB", 0),
                 "warmifa": data.get("warmifA", 0),
                 "warmifb": data.get("warmifB", 0),
-                "created": datetime.now(),
             }
             if frontend != "119":
-                shkdict["lo"] = data["LO" + frontend]
-                shkdict["ssb"] = data["SSB" + frontend]
-                shkdict["mixc"] = data["mixC" + frontend]
+                shkdict["lo"] = data.get("LO" + frontend, numpy.nan)
+                shkdict["ssb"] = data.get("SSB" + frontend, numpy.nan)
+                shkdict["mixc"] = data.get("mixC" + frontend, numpy.nan)
             table_data.append(shkdict)
     logger.debug("upserting %s rows", len(table_data))
-    con.start()
-    for data in table_data:
-        con.upsert("shk_level1", data)
-    con.end()
+    fgr = BinaryCopy(SHK_LEVEL1)
+    fgr.write(*(
+        [[row[column] for row in table_data]
+         for column in ('stw', 'backend', 'frontendsplit')] +
+        [[row.get(column) for row in table_data] for column in SHK_COLUMNS] +
+        [datetime.now()]))
+    data = fgr.getvalue()
+    fgr.close()
+    if pg_string is None:
+        conn = psycopg2.connect(config.get('database', 'pgstring'))
+    else:
+        conn = psycopg2.connect(pg_string)
+    # the 119 GHz rows have no lo, ssb and mixc of their own
+    success = bulk_upsert(
+        conn, 'shk_level1', data, key=('stw', 'backend', 'frontendsplit'),
+        keep=('lo', 'ssb', 'mixc'))
     logger.debug("finished SHK level1 importer")
-
+    conn.close()
     con.close()
+    return 0 if success else 1
 
 
 if __name__ == "__main__":
@@ -20,10 +20,12 @@ setup(
     },
     entry_points={"console_scripts": [
         'create_datamodel = db.admin_tools:create_datamodel',
+        'backfill_shk_wide = db.admin_tools:backfill_shk_wide',
         'download_level0 = util.tools:download_level0',
         "level0file2db = odincal.level0_file_importer:main",
         "level0file_server = odincal.level0_fileserver:main",
         "level0data2db = odincal.level0:level0data2db",
+        "level0data2db_parallel = odincal.level0_parallel_importer:main",
         "level1data2db = odincal.calibration_preprocess:main",
         "level1b_importer = odincal.level1b_importer:level1b_importer",
         "level1b_window_importer = odincal.level1b_window_importer2:level1b_importer",  # noqa
@@ -0,0 +1,211 @@
+import ctypes
+from math import exp, pi, sqrt
+
+import numpy
+
+from odincal.ac_level1a_importer import (
+    Level1a, get_workers, inv_erfc, qCorrect, reduce_spectra, threshold,
+    zeroLag)
+from odincal.correlator import (
+    BAND_START, channel_slices, get_seq, lag_slices)
+from odincal.level1a_fft import get_libfft
+
+
+# the original scalar reduction of a band, as a reference
+
+def reference_threshold(monitor):
+    if (monitor < 0.0 or monitor > 1.0):
+        return 0.0
+    return sqrt(2.0) * inv_erfc(2.0 * monitor)
+
+
+def reference_qcorrect(c, f, n):
+    A = (pi / 2.0) * exp(c * c)
+    B = -A * A * A * (pow((c * c - 1), 2.0) / 6.0)
+    f[0] = 1.0
+    for i in range(1, n):
+        fa = f[i]
+        if (abs(fa) > 0.86):
+            return 0, 0
+        f[i] = (A + B * fa * fa) * fa
+    return 1, f
+
+
+def reference_zerolag(zlag, v):
+    if (zlag >= 1.0 or zlag <= 0.0):
+        return 0.0
+    x = v / inv_erfc(zlag)
+    return x * x / 2.0
+
+
+def reference_reduce_band(lags, monitor_pos, monitor_neg):
+    maxchips = len(lags) / 96
+    nred = maxchips * 112
+    data = numpy.zeros(nred)
+    data[:len(lags)] = lags
+    zlag = data[0]
+    if zlag <= 0 or zlag > 1:
+        return numpy.zeros(nred)
+    power = reference_zerolag(zlag, 1.0)
+    c_pos = reference_threshold(monitor_pos)
+    c_neg = reference_threshold(monitor_neg)
+    if c_pos == 0 or c_neg == 0:
+        return numpy.zeros(nred)
+    cmean = (c_pos + c_neg) / 2.0
+    if abs((c_pos - c_neg) / 2.0 / cmean) > 0.1:
+        return numpy.zeros(nred)
+    ok, data = reference_qcorrect(cmean, data, nred)
+    if ok == 0:
+        return numpy.zeros(nred)
+    data0 = numpy.array(data)
+    get_libfft().odinfft(
+        data0.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+        ctypes.c_int(nred))
+    return data0 * power
+
+
+def make_bands(nchips, nbands, seed=0):
+    rng = numpy.random.RandomState(seed)
+    bands = rng.uniform(-0.05, 0.05, (nbands, nchips * 96))
+    bands[:, 0] = rng.uniform(0.2, 0.6, nbands)
+    return bands
+
+
+def test_vectorized_helpers_match_the_scalar_reference():
+    monitors = numpy.array([-0.1, 0.0, 0.05, 0.16, 0.5, 1.0, 1.2])
+    assert numpy.allclose(
+        threshold(monitors), map(reference_threshold, monitors))
+    zlags = numpy.array([-0.5, 0.0, 0.2, 0.45, 0.99, 1.0, 1.5])
+    assert numpy.allclose(
+        zeroLag(zlags, 1.0), [reference_zerolag(z, 1.0) for z in zlags])
+    data = make_bands(1, 4, 7)
+    data[2, 30] = -0.9  # level too high for the correction
+    cmean = numpy.array([0.9, 1.0, 1.1, 1.2])
+    got = data.copy()
+    valid = qCorrect(cmean, got, 96)
+    assert valid.tolist() == [True, True, False, True]
+    for row, c, ok, lags in zip(got, cmean, valid, data):
+        expected = reference_qcorrect(c, lags.copy(), 96)
+        assert expected[0] == ok
+        if ok:
+            assert numpy.allclose(row, expected[1], rtol=1e-13, atol=0)
+
+
+def test_reduce_ac_matches_the_scalar_reference():
+    bands = [make_bands(nchips, 1, seed)[0]
+             for seed, nchips in enumerate([1, 2, 4, 8, 1, 2, 1, 3])]
+    monitor_pos = numpy.full(len(bands), 0.16)
+    monitor_neg = numpy.full(len(bands), 0.155)
+    monitor_neg[4] = 0.10  # too large difference of the thresholds
+    bands[5][10] = 0.9  # level too high for the correction
+    bands[6][0] = 1.5  # zero lag out of range
+    bands[7][0] = -0.2  # zero lag out of range
+    ac = Level1a('odinfft')
+    ac.reduceAC(bands, monitor_pos, monitor_neg)
+    for ind, lags in enumerate(bands):
+        expected = reference_reduce_band(
+            lags, monitor_pos[ind], monitor_neg[ind])
+        assert expected.any() == (ind < 4)
+        assert numpy.allclose(ac.got[ind], expected, rtol=1e-12, atol=1e-15)
+
+
+def test_reduce_ac_keeps_the_order_of_the_bands():
+    bands = [make_bands(1, 1, 1)[0], make_bands(4, 1, 2)[0],
+             make_bands(1, 1, 3)[0], make_bands(2, 1, 4)[0]]
+    bands[2][0] = 1.5  # invalid zero lag
+    monitors = numpy.full(len(bands), 0.16)
+    ac = Level1a()
+    ac.reduceAC(bands, monitors, monitors)
+    assert [len(got) for got in ac.got] == [112, 448, 112, 224]
+    assert not ac.got[2].any()
+    for ind in (0, 1, 3):
+        ac1 = Level1a()
+        ac1.reduceAC([bands[ind]], monitors[:1], monitors[:1])
+        assert numpy.array_equal(ac.got[ind], ac1.got[0])
+
+
+def test_invalid_bands_are_masked():
+    data = numpy.zeros((5, 112))
+    data[:, :96] = make_bands(1, 5)
+    data[1, 0] = 1.5  # zero lag out of range
+    data[3, 7] = 0.9  # level too high for the quantisation correction
+    monitor_pos = numpy.full(5, 0.16)
+    monitor_neg = numpy.full(5, 0.16)
+    monitor_neg[2] = 0.10  # too large difference of the thresholds
+    ac = Level1a()
+    ac.nred = 112
+    got = ac.reduceBands(data, monitor_pos, monitor_neg)
+    assert [row.any() for row in got] == [True, False, False, False, True]
+
+
+def test_reduce_ac_with_the_numpy_fft():
+    bands = [make_bands(1, 1, 1)[0], make_bands(8, 1, 2)[0]]
+    monitors = numpy.full(len(bands), 0.16)
+    odin = Level1a('odinfft')
+    odin.reduceAC(bands, monitors, monitors)
+    numpy_ = Level1a('numpy')
+    numpy_.reduceAC(bands, monitors, monitors)
+    for expected, got in zip(odin.got, numpy_.got):
+        assert numpy.allclose(got, expected, rtol=0, atol=1e-12)
+
+
+def make_rows(modes):
+    rng = numpy.random.RandomState(5)
+    cc = make_bands(8, len(modes))
+    cc[:, ::96] = rng.uniform(0.2, 0.6, (len(modes), 8))
+    acd_mon = rng.uniform(0.15, 0.16, (len(modes), 8, 2))
+    rows = [{'mode': mode, 'cc': lags.tostring(), 'acd_mon': mon.tostring()}
+            for mode, lags, mon in zip(modes, cc, acd_mon)]
+    return rows, cc, acd_mon
+
+
+def test_spectra_are_reduced_by_mode():
+    modes = [0x00, 0x11, 0x7f, 0x11, 0x24, 0x00]
+    rows, cc, acd_mon = make_rows(modes)
+    spectra = reduce_spectra(rows)
+    assert spectra.shape == (len(modes), 896)
+    ac = Level1a()
+    for mode, lags, mon, spectrum in zip(modes, cc, acd_mon, spectra):
+        band_start = BAND_START[mode]
+        ac.reduceAC([lags[band] for band in lag_slices(mode)],
+                    mon[band_start, 0], mon[band_start, 1])
+        expected = numpy.zeros(896)
+        for band, got in zip(channel_slices(mode), ac.got):
+            expected[band] = abs(got)
+        assert numpy.array_equal(spectrum, expected)
+
+
+def test_spectra_match_the_per_spectrum_reference():
+    modes = [0x00, 0x11, 0x7f, 0x24, 0x55]
+    rows, cc, acd_mon = make_rows(modes)
+    spectra = reduce_spectra(rows)
+    for mode, lags, mon, spectrum in zip(modes, cc, acd_mon, spectra):
+        # the original per-spectrum path of ac_level1a_importer
+        seq, chips, band_start = get_seq(mode)
+        expected = numpy.zeros(8 * 112)
+        for ind, band in enumerate(band_start):
+            cclist = lags[band * 96:(band + len(chips[ind])) * 96]
+            expected[band * 112:(band + len(chips[ind])) * 112] = (
+                reference_reduce_band(
+                    cclist, mon[band, 0], mon[band, 1]))
+        assert expected.any()
+        assert numpy.allclose(
+            spectrum, abs(expected), rtol=1e-12, atol=1e-15)
+
+
+def test_spectra_are_reduced_in_worker_processes():
+    rows = make_rows([0x00, 0x11, 0x7f, 0x11, 0x24, 0x00, 0x55])[0]
+    expected = reduce_spectra(rows)
+    for workers in (2, 3, 10):
+        assert numpy.array_equal(reduce_spectra(rows, workers), expected)
+
+
+def test_workers_are_configured_by_environment(monkeypatch):
+    monkeypatch.delenv('ODINCAL_LEVEL1A_WORKERS', raising=False)
+    monkeypatch.delenv('ODINCAL_LEVEL1A_WORKERS_AC2', raising=False)
+    assert get_workers('AC2') == 1
+    monkeypatch.setenv('ODINCAL_LEVEL1A_WORKERS', '2')
+    assert get_workers('AC2') == 2
+    monkeypatch.setenv('ODINCAL_LEVEL1A_WORKERS_AC2', '4')
+    assert get_workers('AC2') == 4
+    assert get_workers('AC1') == 2
@@ -0,0 +1,24 @@
+import numpy
+
+from odincal.att_level1_importer import djl, interpolate_attitude
+
+
+def test_djl_of_arrays_matches_djl_of_scalars():
+    dates = [(2015, 3, 4, 10, 20, 30.5), (2001, 12, 31, 23, 59, 59.9),
+             (2019, 1, 1, 0, 0, 0.0)]
+    columns = [numpy.array(column) for column in zip(*dates)]
+    assert djl(*columns).tolist() == [djl(*date) for date in dates]
+
+
+def test_attitude_is_interpolated_to_the_midpoints():
+    attstw = numpy.array([1000., 1016., 1032., 1500., 1516.])
+    lookup = numpy.arange(5 * 20, dtype=float).reshape(5, 20)
+    stws = [1024, 1100, 1400, 1520, 990, 1700]
+    midpoints = [1008., 1024., 1300., 1510., 980., 1600.]
+    valid, att = interpolate_attitude(attstw, lookup, stws, midpoints)
+    # 1400: the attitude before the midpoint is too far from the spectrum
+    # 990 and 1700: the midpoint is outside the attitude data
+    assert valid.tolist() == [True, True, False, True, False, False]
+    numpy.testing.assert_allclose(att[0], (lookup[0] + lookup[1]) / 2)
+    numpy.testing.assert_allclose(att[1], (lookup[1] + lookup[2]) / 2)
+    numpy.testing.assert_allclose(att[2], (3 * lookup[3] + 5 * lookup[4]) / 8)
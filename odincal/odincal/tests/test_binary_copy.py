@@ -0,0 +1,124 @@
+from datetime import datetime
+from struct import unpack, unpack_from
+
+import numpy
+import pytest
+
+from odincal.binary_copy import (
+    BinaryCopy, CopyStream, HEADER, encode, iter_copy)
+
+
+def decode(data):
+    """decode the binary COPY format into lists of raw field values"""
+    assert data.startswith(HEADER)
+    assert data.endswith('\xff\xff')
+    data = data[len(HEADER):-2]
+    rows = []
+    offset = 0
+    while offset < len(data):
+        count, = unpack_from('>h', data, offset)
+        offset += 2
+        row = []
+        for ind in range(count):
+            length, = unpack_from('>i', data, offset)
+            offset += 4
+            if length < 0:
+                row.append(None)
+            else:
+                row.append(data[offset:offset + length])
+                offset += length
+        rows.append(row)
+    return rows
+
+
+def decode_array(value, fmt):
+    ndim, hasnull, oid, dim, lbound = unpack_from('>5i', value)
+    assert (ndim, hasnull, lbound) == (1, 0, 1)
+    size = len(value[20:]) / dim - 4
+    elements = []
+    for ind in range(dim):
+        length, element = unpack_from('>i' + fmt, value, 20 + ind * (4 + size))
+        assert length == size
+        elements.append(element)
+    return oid, elements
+
+
+def test_rows_are_encoded_in_binary_copy_format():
+    buf = BinaryCopy(['int8', 'text', 'text', 'float4', 'int4[]',
+                      'float8[]', 'bytea', 'timestamp'])
+    cc = numpy.arange(6, dtype='float64').reshape(3, 2)
+    buf.write(
+        numpy.array([1, 2, 2**40]),
+        'AC1',
+        ['SIG', 'REF', None],
+        numpy.array([0.5, 1.5, 2.5]),
+        numpy.array([[1, 2], [3, 4], [5, 6]]),
+        numpy.array([0.25, 0.75]),
+        cc,
+        datetime(2000, 1, 2, 0, 0, 1, 5))
+    rows = decode(buf.getvalue())
+    assert len(rows) == 3
+    rows.sort(key=lambda row: unpack_from('>q', row[0])[0])
+    for ind, row in enumerate(rows):
+        assert unpack_from('>q', row[0])[0] == [1, 2, 2**40][ind]
+        assert row[1] == 'AC1'
+        assert row[2] == ['SIG', 'REF', None][ind]
+        assert unpack_from('>f', row[3])[0] == [0.5, 1.5, 2.5][ind]
+        assert decode_array(row[4], 'i') == (23, [2 * ind + 1, 2 * ind + 2])
+        assert decode_array(row[5], 'd') == (701, [0.25, 0.75])
+        assert row[6] == cc[ind].tostring()
+        assert unpack_from('>q', row[7])[0] == 86401000005
+
+
+def test_stream_reads_the_batches_as_they_are_produced():
+    types = ['int4', 'text']
+    batches = [(numpy.arange(ind * 10, ind * 10 + 10), 'x')
+               for ind in range(20)]
+    stream = CopyStream(iter_copy(types, batches), maxsize=2)
+    data = []
+    chunk = stream.read(100)
+    while chunk:
+        assert len(chunk) <= 100
+        data.append(chunk)
+        chunk = stream.read(100)
+    stream.close()
+    expect = BinaryCopy(types)
+    for columns in batches:
+        expect.write(*columns)
+    assert ''.join(data) == expect.getvalue()
+
+
+def test_stream_raises_the_error_of_the_producer():
+    def batches():
+        yield (numpy.arange(3),)
+        raise ValueError('bad file')
+    stream = CopyStream(iter_copy(['int4'], batches()))
+    assert stream.read() == HEADER
+    assert stream.read() == encode(['int4'], (numpy.arange(3),))
+    with pytest.raises(ValueError):
+        stream.read()
+    stream.close()
+
+
+def test_closed_stream_stops_the_producer():
+    produced = []
+
+    def chunks():
+        for ind in range(1000):
+            produced.append(ind)
+            yield 'x'
+    stream = CopyStream(chunks(), maxsize=2)
+    assert stream.read() == 'x'
+    stream.close()
+    assert not stream.thread.is_alive()
+    assert len(produced) < 10
+
+
+def test_numbers_may_be_null():
+    buf = BinaryCopy(['int8', 'float4', 'int4'])
+    buf.write([1, 2, 3], [0.5, None, 2.5], numpy.array([7, 8, 9]))
+    rows = sorted(
+        (unpack('>q', row[0])[0],
+         row[1] and unpack('>f', row[1])[0],
+         unpack('>i', row[2])[0]) for row in decode(buf.getvalue()))
+    assert rows == [(1, 0.5, 7), (2, None, 8), (3, 2.5, 9)]
@@ -0,0 +1,80 @@
+from psycopg2 import IntegrityError
+
+from odincal.binary_copy import BinaryCopy
+from odincal.bulk_upsert import bulk_upsert, merge_sql
+
+
+class Cursor(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = [('stw',), ('backend',), ('spectra',)]
+
+    def execute(self, sql):
+        if sql.startswith('insert') or sql.startswith('delete'):
+            if self.conn.failures:
+                self.conn.failures -= 1
+                raise IntegrityError('duplicate key')
+            self.conn.merges.append(sql)
+
+    def copy_expert(self, sql, data, size):
+        self.conn.copies.append(data.read())
+
+    def close(self):
+        pass
+
+
+class Connection(object):
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.copies = []
+        self.merges = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def make_data():
+    buf = BinaryCopy(['int8', 'text', 'bytea'])
+    buf.write([1, 2], 'AC1', ['a', 'b'])
+    return buf.getvalue()
+
+
+def test_merge_sql():
+    columns = ['stw', 'backend', 'soda', 'mjd']
+    assert merge_sql('attitude_level1', columns, ('stw', 'backend', 'soda'),
+                     replace=('stw', 'backend')) == (
+        'delete from attitude_level1 t using foo f '
+        'where t.stw=f.stw and t.backend=f.backend;'
+        'insert into attitude_level1 (stw,backend,soda,mjd) '
+        'select stw,backend,soda,mjd from foo '
+        'on conflict (stw,backend,soda) do update set mjd=excluded.mjd')
+    assert merge_sql('foo_keys', ['stw'], ('stw',)).endswith('do nothing')
+    assert merge_sql('shk_level1', ['stw', 'lo', 'hotloada'], ('stw',),
+                     keep=('lo',)).endswith(
+        'do update set lo=coalesce(excluded.lo,shk_level1.lo),'
+        'hotloada=excluded.hotloada')
+
+
+def test_upsert_is_retried_with_the_same_data():
+    conn = Connection(failures=1)
+    assert bulk_upsert(conn, 'ac_level1a', make_data(), ('backend', 'stw'))
+    assert conn.copies == [make_data(), make_data()]
+    assert (conn.commits, conn.rollbacks) == (1, 1)
+    assert conn.merges == [merge_sql(
+        'ac_level1a', ['stw', 'backend', 'spectra'], ('backend', 'stw'))]
+
+
+def test_failing_upsert_is_reported():
+    conn = Connection(failures=2)
+    assert not bulk_upsert(conn, 'ac_level1a', make_data(), ('backend', 'stw'))
+    assert (conn.commits, conn.rollbacks) == (0, 2)
@@ -0,0 +1,116 @@
+import copy
+
+import numpy
+import pytest
+
+from odincal.calibration_preprocess import (
+    CalibrationWindow, filter_data, scan_frontends, scan_rows, window_index)
+
+
+def window():
+    rows = []
+    for stw, (sig_type, mech_type) in enumerate([
+            ('REF', 'CAL'), ('REF', 'CAL'), ('REF', 'CAL'), ('REF', 'SK1'),
+            ('SIG', 'SK1'), ('REF', 'SK1'), ('REF', 'SK2'), ('REF', 'SK1'),
+            ('SIG', 'SK1')]):
+        for frontendsplit in ('495', '549'):
+            rows.append({
+                'stw': stw, 'start': 0, 'ssb_att': 1,
+                'frontendsplit': frontendsplit, 'sig_type': sig_type,
+                'mech_type': mech_type, 'skybeamhit': 0})
+    return rows
+
+
+def test_filter_data_keeps_the_second_calibration_spectrum():
+    rows = window()
+    indices, sig_types = filter_data(rows, 0, 1, '549', 100)
+    # the first reference after a calibration or SK2 reference is removed
+    assert [rows[ind]['stw'] for ind in indices] == [1, 4, 5, 8]
+    assert all(rows[ind]['frontendsplit'] == '549' for ind in indices)
+    assert sig_types == ['CAL', 'SIG', 'REF', 'SIG']
+
+
+def test_filter_data_does_not_change_the_window():
+    rows = window()
+    original = copy.deepcopy(rows)
+    first = filter_data(rows, 0, 1, '495', 100)
+    assert rows == original
+    assert filter_data(rows, 0, 1, '495', 100) == first
+    assert filter_data(rows, 0, 2, '495', 100) == ([], [])
+
+
+def test_window_index_finds_the_rows_of_a_scan():
+    rows = []
+    for stw, (start, frontendsplit, ssb_att) in enumerate([
+            (100, '495', 1), (100, '549', 1), (300, '495', 1),
+            (200, '495', 1), (300, '495', 2), (500, '549', 1)]):
+        rows.append({'stw': stw, 'start': start, 'ssb_att': ssb_att,
+                     'frontendsplit': frontendsplit})
+    index = window_index(rows)
+    assert scan_frontends(index, 100) == ['495', '549']
+    assert scan_frontends(index, 300) == ['495']
+    assert scan_frontends(index, 400) == []
+    # the rows are given in window order, also when start is not sorted
+    assert scan_rows(index, 200, 1, '495', 100) == [0, 2, 3]
+    assert scan_rows(index, 200, 1, '495', 99) == [3]
+    assert scan_rows(index, 300, 2, '495', 0) == [4]
+    assert scan_rows(index, 300, 2, '549', 1000) == []
+
+
+def test_window_index_of_ssb_att_arrays():
+    rows = [{'stw': stw, 'start': 0, 'frontendsplit': '495',
+             'ssb_att': ssb_att}
+            for stw, ssb_att in enumerate([[1, 2, 3, 4], [1, 2, 3, 5]])]
+    index = window_index(rows)
+    assert scan_rows(index, 0, [1, 2, 3, 5], '495', 0) == [1]
+
+
+def test_calibration_window_holds_columns():
+    fields = ['stw', 'frontendsplit', 'ssb_att', 'lo', 'spectra', 'cc']
+    spectra = numpy.arange(2 * 896.).reshape(2, 896)
+    cc = numpy.arange(2 * 768.).reshape(2, 8, 96)
+    rows = [(stw, '495', [1, 2, 3, stw], 4.9e11, spectra[stw].tostring(),
+             cc[stw].tostring()) for stw in range(2)]
+    window = CalibrationWindow(fields, rows)
+    assert len(window) == 2
+    assert window.columns['spectra'].shape == (2, 896)
+    assert window.columns['cc'].shape == (2, 8, 96)
+    assert window.columns['stw'].dtype == numpy.int64
+    assert window.columns['ssb_att'].shape == (2, 4)
+    row = window[-1]
+    assert row['stw'] == 1 and isinstance(row['stw'], int)
+    assert row['frontendsplit'] == '495'
+    assert row['ssb_att'] == [1, 2, 3, 1]
+    assert row['lo'] == 4.9e11
+    assert row['spectra'].tolist() == spectra[1].tolist()
+    assert row['cc'].tolist() == cc[1].tolist()
+    with pytest.raises(ValueError):
+        row['spectra'][0] = 0
+    with pytest.raises(IndexError):
+        window[2]
+    assert [row['stw'] for row in window] == [0, 1]
+
+
+def test_calibration_window_leaves_out_bad_blobs():
+    fields = ['stw', 'spectra', 'cc']
+    spectra = numpy.arange(896.).tostring()
+    cc = numpy.arange(768.).tostring()
+    rows = [(0, spectra, cc), (1, None, cc), (2, spectra[8:], cc),
+            (3, spectra, cc + cc), (4, spectra, cc)]
+    window = CalibrationWindow(fields, rows)
+    assert [row['stw'] for row in window] == [0, 4]
+    assert window[1]['spectra'].tolist() == range(896)
+    window = CalibrationWindow(fields, rows[1:4])
+    assert len(window) == 0
+    assert window.columns['cc'].shape == (0, 8, 96)
+
+
+def test_calibration_window_is_filtered_like_rows():
+    rows = window()
+    fields = sorted(rows[0])
+    columns = CalibrationWindow(
+        fields, [tuple(row[field] for field in fields) for row in rows])
+    assert window_index(columns) == window_index(rows)
+    for frontendsplit in ('495', '549'):
+        assert (filter_data(columns, 0, 1, frontendsplit, 100) ==
+                filter_data(rows, 0, 1, frontendsplit, 100))
@@ -0,0 +1,24 @@
+import numpy
+
+from odincal.correlator import (
+    NMODES, band_start_mask, channel_slices, get_seq, lag_slices)
+
+
+def test_band_start_mask_matches_get_seq():
+    modes = numpy.arange(NMODES)
+    mask = band_start_mask(modes)
+    for mode in modes:
+        band_start = get_seq(mode)[2]
+        assert numpy.flatnonzero(mask[mode]).tolist() == band_start.tolist()
+
+
+def test_slices_cover_the_chips_of_each_band():
+    for mode in range(NMODES):
+        seq, chips, band_start = get_seq(mode)
+        assert sum(len(band) for band in chips) == 8
+        for band, lags, channels in zip(
+                chips, lag_slices(mode), channel_slices(mode)):
+            assert range(768)[lags] == range(band[0] * 96,
+                                             (band[-1] + 1) * 96)
+            assert range(896)[channels] == range(band[0] * 112,
+                                                 (band[-1] + 1) * 112)
@@ -1,4 +1,15 @@
-from odincal.level0 import stw_correction
+from os.path import dirname, join
+
+import numpy
+import pytest
+
+from oops.level0 import ACfile, SHKfile, HKdata
+from odincal.level0 import (
+    getAC, getACbatch, getACdis, getACheads, getATT, iter_acbatch,
+    last_occurrences, stw_correction)
+from odincal.correlator import band_start_mask
+
+TESTDIR = dirname(__file__)
 
 
 def test_correction():
@@ -9,3 +20,295 @@ def test_correction():
             ('30683ad2.ac2', 3 * 2**32),
         ]:
         assert stw_correction(file_set[0]) == file_set[1]
+
+
+def test_blocks_match_sequential_reader():
+    shk = SHKfile(join(TESTDIR, 'testfile.shk'))
+    blocks = shk.getBlocks()
+    for block in blocks:
+        words = shk.getBlock()
+        assert block['stw'] == shk.stw
+        assert block['words'].tolist() == list(words)
+    assert shk.getBlock() == []
+
+
+def test_ac_spectrum_heads():
+    ac = ACfile(join(TESTDIR, 'testfile.ac1'))
+    heads = []
+    while ac.getSpectrumHead() is not None:
+        stw = ac.stw
+        data = [ac.getBlock() for _ in range(12)]
+        if data[-1]:
+            heads.append(stw)
+    blocks = ac.getBlocks()
+    assert blocks['stw'][ac.getSpectrumHeads(blocks)].tolist() == heads
+
+
+def reference_blocks(shk):
+    """the stw and words of every block, read with the sequential reader"""
+    shk.rewind()
+    blocks = []
+    words = shk.getBlock()
+    while words:
+        blocks.append((shk.stw, words))
+        words = shk.getBlock()
+    return blocks
+
+
+def reference_hkword(shk, which, sub=-1):
+    """the per-channel loop of the original SHKfile.getHKword"""
+    stw = []
+    data = []
+    for blockstw, words in reference_blocks(shk):
+        word = words[which]
+        found = (word != 0xffff)
+        if sub > -1:
+            found = ((word & 0x000f) == sub)
+            word = word >> 4
+        if found:
+            stw.append(blockstw)
+            data.append(word)
+    return stw, data
+
+
+def reference_lofreqs(shk):
+    """the loop of the original SHKfile.getLOfreqs"""
+    def sub(word):
+        return word & 0x000f
+
+    def freq(hro, pro, m):
+        return ((4000.0 + hro) * m + pro / 32.0 + 100.0) * 6.0e6
+    blocks = reference_blocks(shk)
+    stw = [blockstw for blockstw, _ in blocks]
+    aside = [int(words[21]) for _, words in blocks]
+    bside = [int(words[29]) for _, words in blocks]
+    STWa, STWb, LO495, LO549, LO555, LO572 = [], [], [], [], [], []
+    for i in range(len(stw) - 3):
+        if sub(aside[i]) == 0:
+            STWa.append(stw[i])
+            if sub(aside[i + 1]) == 1:
+                LO495.append(freq(aside[i] >> 4, aside[i + 1] >> 4, 17.0))
+            else:
+                LO495.append(0.0)
+            if sub(aside[i + 2]) == 2 and sub(aside[i + 3]) == 3:
+                LO549.append(
+                    freq(aside[i + 2] >> 4, aside[i + 3] >> 4, 19.0))
+            else:
+                LO549.append(0.0)
+        if sub(bside[i]) == 0:
+            STWb.append(stw[i])
+            if sub(bside[i + 1]) == 1:
+                LO572.append(freq(bside[i] >> 4, bside[i + 1] >> 4, 20.0))
+            else:
+                LO572.append(0.0)
+            if sub(bside[i + 2]) == 2 and sub(bside[i + 3]) == 3:
+                LO555.append(
+                    freq(bside[i + 2] >> 4, bside[i + 3] >> 4, 19.0))
+            else:
+                LO555.append(0.0)
+    return (STWa, LO495, LO549, STWb, LO555, LO572)
+
+
+def reference_ssbtunings(shk):
+    """the loop of the original SHKfile.getSSBtunings"""
+    def sub(word):
+        return word & 0x000f
+    stw, aside, bside, which = [], [], [], []
+    for blockstw, words in reference_blocks(shk):
+        stw.append(blockstw)
+        if words[35] != 0xffff and words[36] != 0xffff:
+            aside.append(words[35])
+            bside.append(words[36])
+            which.append('A')
+        else:
+            aside.append(words[41])
+            bside.append(words[42])
+            which.append('B')
+    i = 0
+    STW, SSB495, SSB549, SSB555, SSB572 = [], [], [], [], []
+    while i < len(stw) - 2:
+        if (sub(aside[i]) == 0 and sub(bside[i]) == 0 and
+                sub(aside[i + 2]) == 2 and sub(bside[i + 2]) == 2):
+            STW.append(stw[i])
+            if which[i] == 'A':
+                SSB495.append(aside[i] >> 4)
+                SSB572.append(aside[i + 2] >> 4)
+                SSB549.append(bside[i] >> 4)
+                SSB555.append(bside[i + 2] >> 4)
+            else:
+                SSB495.append(aside[i + 2] >> 4)
+                SSB572.append(aside[i] >> 4)
+                SSB549.append(bside[i + 2] >> 4)
+                SSB555.append(bside[i] >> 4)
+            i = i + 2
+        else:
+            i = i + 1
+    return (STW, SSB495, SSB549, SSB555, SSB572)
+
+
+def test_single_pass_shk_matches_per_channel_reads():
+    shk = SHKfile(join(TESTDIR, 'testfile.shk'))
+    hkdata, lofreqs, ssbtunings = shk.getSHKdata(HKdata.keys())
+    nonempty = 0
+    for name, table in HKdata.items():
+        stw, data = reference_hkword(shk, table[0], sub=table[1])
+        nonempty += len(stw) > 0
+        assert hkdata[name][0].tolist() == stw
+        assert hkdata[name][1].tolist() == map(table[2], data)
+    assert nonempty
+    expect = reference_lofreqs(shk)
+    assert len(expect[0]) and len(expect[3])
+    assert [column.tolist() for column in lofreqs] == list(expect)
+    expect = reference_ssbtunings(shk)
+    assert len(expect[0])
+    assert [column.tolist() for column in ssbtunings] == list(expect)
+
+
+def reference_ac(ac):
+    """the per-spectrum decoding of the original getAC, yielding the
+    dictionary of every spectrum together with its discipline"""
+    CLOCKFREQ = 224.0e6
+    ac2 = ACfile(ac.name)
+    head = ac.getSpectrumHead()
+    while head is not None:
+        discipline = getACdis(ac2)
+        stw = ac.stw
+        data = [ac.getBlock() for j in range(12)]
+        if data[-1] == []:
+            return
+        for j in range(11):
+            ac2.getBlock()
+        cc64 = numpy.array(data, dtype='int16').reshape(8, 96)
+        cc64 = cc64.astype('int64')
+        lags64 = numpy.array(head[50:58], dtype='int64')
+        zlags = numpy.left_shift(lags64, 4) + \
+            numpy.bitwise_and(cc64[:, 0], 0xf)
+        zlags.shape = (8, 1)
+        mode = ac.Mode(head)
+        band_start = band_start_mask(mode)
+        cc64[band_start, 0] = zlags[band_start, 0]
+        cc64[band_start & (cc64[:, 2] > 0), 2] -= 65536
+        IntTime = ac.IntTime(head)
+        if IntTime == 0:
+            IntTime = 9999.0
+        cc64 = cc64 * 2048.0 * (1 / IntTime) / (CLOCKFREQ / 2.0)
+        mon64 = numpy.array(head[16:32], dtype='uint16').reshape(8, 2)
+        mon64 = numpy.bitwise_and(zlags, 0xf0000) + mon64
+        overflow_mask = numpy.abs(mon64 - zlags) > 0x8000
+        mon64[overflow_mask & (mon64 > zlags)] -= 0x10000
+        mon64[overflow_mask & (mon64 < zlags)] += 0x10000
+        mon64 = mon64 * 1024.0 * (1 / IntTime) / (CLOCKFREQ / 2.0)
+        yield {
+            'stw': stw,
+            'backend': ac.type,
+            'frontend': ac.Frontend(head),
+            'sig_type': ac.Type(head),
+            'ssb_att': "{{{0},{1},{2},{3}}}".format(*ac.Attenuation(head)),
+            'ssb_fq': "{{{0},{1},{2},{3}}}".format(*ac.SSBfrequency(head)),
+            'prescaler': head[49],
+            'inttime': IntTime,
+            'mode': mode,
+            'acd_mon': mon64,
+            'cc': cc64,
+        }, discipline
+        head = ac.getSpectrumHead()
+
+
+def test_ac_spectra_are_read_in_sequence():
+    for name in ('testfile.ac1', 'testfile.ac2'):
+        ac = ACfile(join(TESTDIR, name))
+        ac2 = ACfile(join(TESTDIR, name))
+        batch = getACbatch(ACfile(join(TESTDIR, name)))
+        assert len(batch['stw'])
+        for i, stw in enumerate(batch['stw']):
+            datadict = getAC(ac)
+            assert getACdis(ac2) == batch['discipline'][i]
+            for j in range(11):
+                ac2.getBlock()
+            assert datadict['stw'] == stw
+            assert (datadict['cc'] == batch['cc'][i]).all()
+            assert (datadict['acd_mon'] == batch['acd_mon'][i]).all()
+        with pytest.raises(EOFError):
+            getAC(ac)
+
+
+def without_inttime(tmpdir, name):
+    """a copy of the test file where the first spectrum has a prescaler
+    out of range, and hence no integration time"""
+    ac = ACfile(join(TESTDIR, name))
+    head = ac.getSpectrumHeads()[0]
+    with open(join(TESTDIR, name), 'rb') as testfile:
+        data = bytearray(testfile.read())
+    data[head * ac.blocksize + (4 + 49) * 2] = 0
+    acfile = tmpdir.join(name)
+    acfile.write(str(data), mode='wb')
+    return str(acfile)
+
+
+def test_batched_ac_decoding_matches_per_spectrum_decoding(tmpdir):
+    for name in ('testfile.ac1', 'testfile.ac2',
+                 without_inttime(tmpdir, 'testfile.ac1')):
+        batch = getACbatch(ACfile(join(TESTDIR, name)))
+        spectra = list(reference_ac(ACfile(join(TESTDIR, name))))
+        assert len(batch['stw']) == len(spectra)
+        for i, (datadict, discipline) in enumerate(spectra):
+            assert batch['discipline'][i] == discipline
+            assert batch['backend'] == datadict['backend']
+            for key in ('stw', 'frontend', 'sig_type', 'prescaler',
+                        'inttime', 'mode'):
+                assert batch[key][i] == datadict[key]
+            for key in ('ssb_att', 'ssb_fq'):
+                assert (
+                    '{' + ','.join(map(str, batch[key][i])) + '}' ==
+                    datadict[key])
+            assert (batch['acd_mon'][i] == datadict['acd_mon']).all()
+            assert (batch['cc'][i] == datadict['cc']).all()
+    assert batch['inttime'][0] == 9999
+    assert batch['cc'][0].any()
+
+
+def test_ac_batches_cover_all_spectra():
+    ac = ACfile(join(TESTDIR, 'testfile.ac1'))
+    batch = getACbatch(ac)
+    batches = list(iter_acbatch(ac, size=2))
+    assert [len(spectra['stw']) for spectra in batches] == [2, 1]
+    for key in ('stw', 'cc', 'acd_mon', 'mode'):
+        assert (numpy.concatenate([spectra[key] for spectra in batches]) ==
+                batch[key]).all()
+
+
+def test_last_occurrence_of_duplicates_is_kept():
+    keys = numpy.array([5, 3, 5, 1, 3, 5])
+    assert last_occurrences(keys).tolist() == [3, 4, 5]
+
+
+def test_ac_heads_are_unique_and_valid(tmpdir):
+    acfile = tmpdir.join('0a1b2c3d.ac1')
+    with open(join(TESTDIR, 'testfile.ac1'), 'rb') as testfile:
+        acfile.write(testfile.read() * 2, mode='wb')
+    ac = ACfile(str(acfile))
+    heads = getACheads(ac)
+    batch = getACbatch(ac, heads)
+    assert len(set(batch['stw'])) == len(heads)
+    assert (batch['discipline'] == 'AERO').all()
+    assert (batch['inttime'] != 9999).all()
+
+
+def test_attitude_duplicates_and_neighbours_are_resolved(tmpdir):
+    def line(stw, qe):
+        return ' '.join(
+            ['20100102', '3', '4', '5.5', str(stw), '1234.5'] +
+            ['0.5'] * 8 + [str(qe)] * 3 + ['7.0'] * 6) + '\n'
+    attfile = tmpdir.join('test.att')
+    attfile.write(''.join(
+        ['soda version 4.0\n', 'EOF\n'] + ['\n'] * 5 + [
+            line(100, 0.2), line(100, 0.1), line(100, 0.1),
+            line(110, 0.3), line(200, 0.1), line(210, 0.1),
+            line(300, 0.1), '\n', line(400, 0.1)]))
+    datadict = getATT(str(attfile))
+    assert datadict['soda'] == 4
+    assert datadict['stw'].tolist() == [100, 200, 210, 300]
+    assert datadict['qe'][0].tolist() == [0.1, 0.1, 0.1]
+    assert datadict['year'][0] == 2010
+    assert datadict['mon'][0] == 1
+    assert datadict['day'][0] == 2
@@ -0,0 +1,52 @@
+from os.path import dirname, join
+
+from oops.level0 import ACfile
+from odincal.level0 import getACheads, iter_level0
+from odincal.level0_index import read_sidecar, write_sidecar
+
+TESTDIR = dirname(__file__)
+
+
+def copy_testfile(tmpdir, name, extension):
+    datafile = str(tmpdir.join(name + extension))
+    with open(join(TESTDIR, 'testfile' + extension), 'rb') as testfile:
+        with open(datafile, 'wb') as level0file:
+            level0file.write(testfile.read())
+    return datafile
+
+
+def test_index_of_ac_file(tmpdir):
+    datafile = copy_testfile(tmpdir, '0a1b2c3d', '.ac1')
+    index = {}
+    rows = list(iter_level0(datafile, index))
+    ac = ACfile(datafile)
+    blocks = ac.getBlocks()
+    stws = sorted(blocks['stw'][getACheads(ac)])
+    assert index['file'] == '0a1b2c3d.ac1'
+    assert index['file_type'] == 'AC1'
+    assert index['blocks'] == len(blocks)
+    assert index['first_stw'] == blocks['stw'].min()
+    assert index['last_stw'] == blocks['stw'].max()
+    assert index['aero'] + index['astr'] + index['problem'] == len(
+        ac.getSpectrumHeads(blocks))
+    assert index['nrows'] == sum(len(columns[0]) for columns in rows) == 3
+    assert (index['min_stw'], index['max_stw']) == (stws[0], stws[-1])
+
+
+def test_index_of_shk_file(tmpdir):
+    datafile = copy_testfile(tmpdir, '0a1b2c3d', '.shk')
+    index = {}
+    rows = list(iter_level0(datafile, index))
+    assert index['file_type'] == 'SHK'
+    assert index['nrows'] == sum(len(columns[0]) for columns in rows)
+    assert index['first_stw'] <= index['min_stw'] <= index['max_stw']
+    assert index['max_stw'] <= index['last_stw']
+
+
+def test_sidecar_roundtrip(tmpdir):
+    datafile = copy_testfile(tmpdir, '0a1b2c3d', '.ac2')
+    assert read_sidecar(datafile) is None
+    index = {}
+    list(iter_level0(datafile, index))
+    write_sidecar(datafile, index)
+    assert read_sidecar(datafile) == index
@@ -0,0 +1,98 @@
+from multiprocessing import Semaphore
+from os.path import dirname, exists, join
+
+from odincal import level0_parallel_importer
+from odincal.binary_copy import iter_copy
+from odincal.level0 import AC_LEVEL0, iter_level0
+from odincal.level0_index import SIDECAR
+from odincal.level0_parallel_importer import get_stages, import_file
+
+TESTDIR = dirname(__file__)
+
+
+class Cursor(object):
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        self.conn.queries.append(query)
+
+    def copy_expert(self, query, data, size):
+        self.conn.copied.append(''.join(iter(lambda: data.read(size), '')))
+
+    def close(self):
+        pass
+
+
+class Connection(object):
+    def __init__(self):
+        self.queries = []
+        self.copied = []
+        self.state = 'open'
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        self.state = 'committed'
+
+    def rollback(self):
+        self.state = 'rolled back'
+
+    def close(self):
+        pass
+
+
+def connect(monkeypatch):
+    conn = Connection()
+    monkeypatch.setattr(
+        level0_parallel_importer.psycopg2, 'connect', lambda dsn: conn)
+    return conn
+
+
+def test_ac_files_are_imported_after_the_files_they_need():
+    stages = get_stages([TESTDIR])
+    assert [[name[-3:] for name in stage] for stage in stages] == [
+        ['shk'], ['ac1', 'ac2']]
+
+
+def copy_testfile(tmpdir):
+    datafile = str(tmpdir.join('0a1b2c3d.ac1'))
+    with open(join(TESTDIR, 'testfile.ac1'), 'rb') as testfile:
+        with open(datafile, 'wb') as acfile:
+            acfile.write(testfile.read())
+    return datafile
+
+
+def test_file_is_streamed_into_the_database(tmpdir, monkeypatch):
+    conn = connect(monkeypatch)
+    datafile = copy_testfile(tmpdir)
+    assert import_file(datafile)
+    assert conn.state == 'committed'
+    expect = ''.join(iter_copy(AC_LEVEL0, iter_level0(datafile)))
+    # only the created timestamps of the batches may differ
+    assert len(conn.copied[0]) == len(expect)
+    assert exists(datafile + SIDECAR)
+
+
+def test_failing_file_is_reported(monkeypatch):
+    conn = connect(monkeypatch)
+    datafile = join(TESTDIR, 'testfile.ac1')
+    # the name of the file is not the hex stw that it should be
+    assert not import_file(datafile)
+    assert conn.state == 'rolled back'
+
+
+def test_files_wait_for_a_shared_connection(tmpdir, monkeypatch):
+    connections = Semaphore(1)
+    monkeypatch.setattr(level0_parallel_importer, '_connections', connections)
+    held = []
+
+    def connect(dsn):
+        held.append(not connections.acquire(False))
+        return Connection()
+    monkeypatch.setattr(level0_parallel_importer.psycopg2, 'connect', connect)
+    assert import_file(copy_testfile(tmpdir))
+    assert not import_file(join(TESTDIR, 'testfile.ac1'))
+    assert held == [True, True]
+    assert connections.acquire(False)
@@ -0,0 +1,56 @@
+import ctypes
+
+import numpy
+import pytest
+
+from odincal.level1a_fft import (
+    FFT_BACKENDS, benchmark, get_fft, get_libfft, numpy_fft, odinfft)
+
+
+def make_lags(nchips, nbands, seed=0):
+    rng = numpy.random.RandomState(seed)
+    data = numpy.zeros((nbands, nchips * 112))
+    data[:, :nchips * 96] = rng.uniform(-0.5, 0.5, (nbands, nchips * 96))
+    data[:, 0] = 1.0
+    return data
+
+
+def test_fft_library_is_loaded_once():
+    assert get_libfft() is get_libfft()
+
+
+def test_batched_fft_matches_single_fft():
+    data = make_lags(2, 5)
+    batched = odinfft(data)
+    for row, expected in zip(data, batched):
+        row = row.copy()
+        get_libfft().odinfft(
+            row.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+            ctypes.c_int(len(row)))
+        assert numpy.array_equal(row, expected)
+
+
+@pytest.mark.parametrize('nchips', range(1, 9))
+def test_numpy_fft_matches_odinfft(nchips):
+    data = make_lags(nchips, 4, nchips)
+    expected = odinfft(data)
+    got = numpy_fft(data)
+    assert got.shape == expected.shape
+    assert numpy.allclose(got, expected, rtol=0, atol=1e-12)
+    # the input is left untouched
+    assert numpy.array_equal(data, make_lags(nchips, 4, nchips))
+
+
+def test_fft_backend_is_selected_by_environment(monkeypatch):
+    monkeypatch.delenv('ODINCAL_FFT', raising=False)
+    assert get_fft() is odinfft
+    monkeypatch.setenv('ODINCAL_FFT', 'numpy')
+    assert get_fft() is numpy_fft
+    assert get_fft('odinfft') is odinfft
+    with pytest.raises(ValueError):
+        get_fft('fftw')
+
+
+def test_benchmark_of_the_backends():
+    for backend in FFT_BACKENDS:
+        assert benchmark(backend, nspectra=10, nchips=2, repeat=1) > 0
@@ -0,0 +1,54 @@
+import numpy
+
+from odincal import level1b_window_importer2
+from odincal.level1b_window_importer2 import (
+    frequency_calibrate, frequency_calibrate_row)
+
+
+def row(stw, sig_type='REF'):
+    return {
+        'start': 0, 'stw': stw, 'ssb_fq': [0, 0, 0, 0], 'backend': 'AC1',
+        'frontend': '549', 'frontendsplit': '549', 'vgeo': 0.,
+        'mode': 0, 'hotloada': 290., 'hotloadb': 290.,
+        'sig_type': sig_type, 'qerror': [0.] * 3, 'qachieved': [0.] * 4,
+        'inttime': 0.86, 'lo': 548.502e9, 'ssb': 2000., 'imageloadb': 280.,
+        'imageloada': 280., 'mixc': 0.3, 'latitude': 0., 'longitude': 0.,
+        'altitude': 0., 'skybeamhit': 0, 'ssb_att': 1,
+        'spectra': numpy.arange(896.).tostring(),
+        'cc': numpy.zeros(768).tostring()}
+
+
+def test_rows_are_frequency_calibrated_once(monkeypatch):
+    calibrate_row = level1b_window_importer2.frequency_calibrate_row
+    calibrated = []
+
+    def counting_calibrate_row(row, con):
+        calibrated.append(row['stw'])
+        return calibrate_row(row, con)
+
+    monkeypatch.setattr(
+        level1b_window_importer2, 'frequency_calibrate_row',
+        counting_calibrate_row)
+    rows = [row(16), row(32)]
+    cache = {}
+    first = frequency_calibrate(rows, ['REF', 'CAL'], None, cache)
+    assert [spec.type for spec in first] == ['REF', 'CAL']
+    assert first[0].freqmode == 2
+    # the spectra of a scan may be changed by the intensity calibration
+    first[0].data[:] = 0
+    first[0].zerolag[:] = 0
+    first[0].gain.append(1.)
+    first[0].type = 'SPE'
+    second = frequency_calibrate(rows, ['CAL', 'REF'], None, cache)
+    assert calibrated == [16, 32]
+    assert [spec.type for spec in second] == ['CAL', 'REF']
+    assert second[0].data.tolist() == numpy.arange(896.).tolist()
+    assert second[0].skyfreq == first[0].skyfreq
+    fresh = frequency_calibrate_row(row(16), None)
+    fresh.type = 'CAL'
+    assert sorted(vars(second[0])) == sorted(vars(fresh))
+    for key, value in vars(fresh).items():
+        if isinstance(value, numpy.ndarray):
+            assert value.tolist() == getattr(second[0], key).tolist()
+        else:
+            assert value == getattr(second[0], key)
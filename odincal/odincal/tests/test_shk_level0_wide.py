@@ -0,0 +1,52 @@
+from odincal.shk_level0_wide import (
+    BACKFILL, COLUMNS, MERGE, SHK_CHANNELS, get_shk_wide, select_wide)
+
+
+class Result(object):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def dictresult(self):
+        return self.rows
+
+
+class Connection(object):
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query(self, query, params):
+        self.queries.append((query, params))
+        return Result(self.rows)
+
+
+def test_every_shk_type_has_a_column():
+    types = [shk_type for shk_type, _ in SHK_CHANNELS]
+    assert len(set(types)) == len(set(COLUMNS)) == 24
+    query = select_wide('foo')
+    for shk_type in types:
+        assert "shk_type='{0}'".format(shk_type) in query
+    assert query.endswith('from foo group by stw')
+    assert MERGE.startswith(
+        'delete from shk_level0_wide w using foo f where f.stw=w.stw;')
+    assert BACKFILL.endswith(
+        'from shk_level0 group by stw on conflict (stw) do nothing')
+
+
+def test_wide_rows_are_named_by_shk_type():
+    row = dict.fromkeys(COLUMNS)
+    row.update(stw=10, hotloada=290., mixer119a=1.5)
+    con = Connection([row])
+    shk = get_shk_wide(con, 0, 100)
+    assert con.queries[0][1] == (0, 100)
+    assert shk.index.tolist() == [10]
+    assert shk['hotloadA'][10] == 290.
+    assert shk['119mixerA'][10] == 1.5
+    assert shk['LO495'].isnull().all()
+
+
+def test_no_wide_rows_gives_all_columns():
+    shk = get_shk_wide(Connection([]), 0, 100)
+    assert shk.empty
+    assert sorted(shk.columns) == sorted(
+        shk_type for shk_type, _ in SHK_CHANNELS)
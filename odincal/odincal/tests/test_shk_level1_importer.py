@@ -0,0 +1,31 @@
+import numpy
+from pandas import DataFrame
+
+from odincal.shk_level1_importer import match_shk
+
+
+def shk_frame(**columns):
+    """a frame like get_shk_wide of columns given as {stw: value}"""
+    return DataFrame(columns).sort_index()
+
+
+def test_spectra_are_matched_with_the_next_shk_value_in_range():
+    shk = shk_frame(
+        hotloadA={100: 1., 3000: 3.}, LO495={2100: 4., 4000: 5.},
+        LO549={})
+    wide = match_shk([10, 100, 1000, 3000, 6100, 10], shk)
+    assert wide.index.tolist() == [10, 100, 1000, 3000, 6100]
+    # exact matches and values up to 2080 stw after a spectrum are matched,
+    # while earlier values and values further away are not
+    assert wide['hotloadA'].tolist()[:4] == [1., 1., 3., 3.]
+    assert wide['LO495'].tolist()[1:4] == [4., 4., 5.]
+    assert numpy.isnan(wide['LO495'][10])
+    assert wide.loc[6100].isnull().all()
+    # types without any data are left out
+    assert 'LO549' not in wide
+
+
+def test_no_shk_data_gives_no_columns():
+    wide = match_shk([10, 20], shk_frame(hotloadA={}))
+    assert wide.index.tolist() == [10, 20]
+    assert wide.columns.tolist() == []
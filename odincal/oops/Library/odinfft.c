@@ -597,3 +597,15 @@ void odinfft(double data[], int n)
     for (i = 5*n/7; i < 6*n/7; i++)  data[i] = matrix[4][6*n/7-i];
     for (i = 6*n/7; i < 7*n/7; i++)  data[i] = matrix[3][i-6*n/7];
 }
+
+/*
+  Transform m sequences of n correlation coefficients each, stored one
+  after the other in data, see odinfft. This saves the overhead of one
+  call per sequence when many spectra are reduced at once.
+*/
+void odinfft_batch(double data[], int n, int m)
+{
+    int i;
+
+    for (i = 0; i < m; i++) odinfft(data+i*n, n);
+}
@@ -13,5 +13,6 @@ void fft32(double []);
 void realft32xN(double [], int);
 void hanning(double [], int);
 void odinfft(double [], int);
+void odinfft_batch(double [], int, int);
 
 #endif
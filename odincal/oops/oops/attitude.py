@@ -3,6 +3,7 @@
 import sys
 import os
 import string
+import numpy
 import odin
 
 
@@ -137,6 +138,142 @@ class AttitudeParser:
             return None
 
 
+class AttitudeTable:
+    """Columnar version of AttitudeParser.
+
+    The data section of the files is parsed into numpy arrays in one go.
+    The table attribute is a dictionary of arrays (one element or row per
+    attitude, sorted by stw) with the same fields as the tuples of
+    AttitudeParser. Duplicated stws are resolved by keeping the attitude
+    with the smallest quaternion error.
+    """
+
+    def __init__(self, files, stw0=0, stw1=0x800000000):
+        self.files = files
+        self.stw0 = stw0
+        self.stw1 = stw1
+        self.soda = 0
+        m = 0
+        tables = []
+        for file in files:
+            odin.Info("processing file %s" % (file))
+            input = open(file, 'r')
+            # first extract soda version
+            line0 = input.readline()
+            line1 = line0.rsplit()
+            self.soda = int(float(line1[len(line1) - 1]))
+            line = input.readline()
+            while line and line != 'EOF\n':
+                line = input.readline()
+            for k in range(5):
+                input.readline()
+            table = self.getLines(input.readlines())
+            input.close()
+            inside = (table['stw'] >= stw0) & (table['stw'] <= stw1)
+            for key in table:
+                table[key] = table[key][inside]
+            n = len(table['stw'])
+            odin.Info("total of %5d lines in file %s" %
+                      (n, os.path.basename(file)))
+            m = m + n
+            tables.append(table)
+
+        if len(files) > 1:
+            odin.Info("total of %5d lines" % (m))
+
+        if tables:
+            self.table = dict(
+                (key, numpy.concatenate([t[key] for t in tables]))
+                for key in tables[0])
+        else:
+            self.table = self.getLines([])
+        self.table = self.Select(self.table, self.Unique(self.table))
+
+    def getLines(self, lines):
+        """parse the data lines of an attitude file into arrays"""
+        rows = map(string.split, lines)
+        lengths = numpy.array(map(len, rows), dtype=int)
+        # the data section ends at the first line with missing columns
+        short = numpy.flatnonzero(lengths < 23)
+        if len(short):
+            rows = rows[:short[0]]
+            lengths = lengths[:short[0]]
+        values = numpy.array([cols[:23] for cols in rows], dtype=float)
+        values.shape = (len(rows), 23)
+        date = values[:, 0].astype(int)
+        # new attitude format, cols[34] == 5 indicates astronomy fine pointing
+        acs = numpy.zeros(len(rows))
+        new = numpy.flatnonzero(lengths == 37)
+        if len(new):
+            fine = numpy.array([rows[i][34] for i in new], dtype=int) == 5
+            acs[new[fine]] = numpy.array(
+                [rows[i][36] for i in new[fine]], dtype=float)
+        return {
+            'year': date / 10000,
+            'mon': date / 100 % 100,
+            'day': date % 100,
+            'hour': values[:, 1].astype(int),
+            'min': values[:, 2].astype(int),
+            'secs': values[:, 3],
+            'stw': values[:, 4].astype('int64'),
+            'orbit': values[:, 5],
+            'qt': values[:, 6:10],
+            'qa': values[:, 10:14],
+            'qe': values[:, 14:17],
+            'gps': values[:, 17:23],
+            'acs': acs,
+        }
+
+    def Errors(self, table):
+        qe = table['qe']
+        return qe[:, 0] * qe[:, 0] + qe[:, 1] * qe[:, 1] + qe[:, 2] * qe[:, 2]
+
+    def Select(self, table, index):
+        return dict((key, table[key][index]) for key in table)
+
+    def Unique(self, table):
+        """index of the attitude with the smallest error (the first one on
+        ties) for each stw, in stw order"""
+        stw = table['stw']
+        order = numpy.lexsort(
+            (numpy.arange(len(stw)), self.Errors(table), stw))
+        first = numpy.ones(len(order), dtype=bool)
+        first[1:] = stw[order][1:] != stw[order][:-1]
+        return order[first]
+
+    def ResolveNeighbours(self, gap=17):
+        """of attitudes closer than gap stws, keep the one with the smallest
+        quaternion error (unless their errors are identical)"""
+        table = self.table
+        stw = table['stw']
+        close = numpy.diff(stw) < gap
+        if not close.any():
+            return table
+        # the comparison restarts after every gap, so only runs of close
+        # attitudes have to be walked through
+        starts = numpy.flatnonzero(numpy.concatenate(([True], ~close)))
+        ends = numpy.append(starts[1:], len(stw))
+        runs = numpy.flatnonzero(ends - starts > 1)
+        keep = numpy.ones(len(stw), dtype=bool)
+        stws = stw.tolist()
+        errs = self.Errors(table).tolist()
+        qes = table['qe'].tolist()
+        for start, end in zip(starts[runs], ends[runs]):
+            key0 = start
+            for key1 in xrange(start + 1, end):
+                if stws[key1] - stws[key0] < gap:
+                    if qes[key0] != qes[key1]:
+                        if errs[key1] < errs[key0]:
+                            keep[key0] = False
+                            key0 = key1
+                        else:
+                            keep[key1] = False
+                else:
+                    key0 = key1
+        self.table = self.Select(table, keep)
+        return self.table
+
+
 if __name__ == "__main__":
     import time
     odin.LogAs("python")
@@ -2,6 +2,8 @@
 import sys
 import struct
 
+import numpy
+
 SSB_PARAMS = {
     '495': (61600.36, 104188.89, 0.0002977862, 313.0),
     '549': (57901.86, 109682.58, 0.0003117128, 313.0),
@@ -93,6 +95,29 @@ class Level0File:
             words = []
         return words
 
+    def getBlocks(self):
+        """ Memory-map all complete blocks of the file as a numpy
+        structured array with the columns 'sync', 'stw', 'user',
+        'words' (the payload as returned by getBlock) and 'index'
+        (the index word as decoded by getIndex) """
+        n = self.blocksize / 2
+        dtype = numpy.dtype([
+            ('sync', '<u2'),
+            ('stw', '<u4'),
+            ('user', '<u2'),
+            ('words', '<u2', (n - 4 - self.tail,)),
+            ('index', '<u2'),
+            ('tail', '<u2', (self.tail - 1,)),
+        ])
+        position = self.input.tell()
+        self.input.seek(0, 2)
+        nblocks = self.input.tell() / self.blocksize
+        self.input.seek(position, 0)
+        if nblocks == 0:
+            return numpy.zeros((0,), dtype=dtype)
+        return numpy.memmap(self.name, dtype=dtype, mode='r',
+                            shape=(nblocks,))
+
     def rewind(self):
         self.input.seek(0, 0)
 
@@ -177,7 +202,7 @@ HKdata = {
     'SSB mechanism B 555': [42, 2, lambda x: x],
     '119GHz voltage': [46, 4, lambda x: -56.0 + x * 112.0 / 4095.0],
     '119GHz current': [46, 12, lambda x: -1091.0 + x * 2178.0 / 4095.0],
-    'ACDC1 sync': [47, -1, lambda x: (int(x) >> 8) & 0x000f],
+    'ACDC1 sync': [47, -1, lambda x: (numpy.asarray(x, dtype=int) >> 8) & 0x000f],
     'ACDC2 sync': [48, -1, lambda x: (x >> 3) & 0x000f],
     '119GHz DRO': [13, 1, lambda x: 944.035 - (0.8374 - (2.567e-4 - 2.74e-8 * x) * x) * x],
     'ACS availability': [49, 13, lambda x: x]
@@ -194,131 +219,104 @@ class SHKfile(Level0File):
             raise TypeError
 
     def getHKword(self, which, sub=-1):
-        self.rewind()
-        stw = []
-        data = []
-        words = self.getBlock()
-        while words:
-            word = words[which]
-            found = (word != 0xffff)
-            if sub > -1:
-                found = ((word & 0x000f) == sub)
-                word = word >> 4
-            if found:
-                stw.append(self.stw)
-                data.append(word)
-            words = self.getBlock()
-        return stw, data
+        stw, data = self.HKword(self.getBlocks(), which, sub)
+        return stw.tolist(), data.tolist()
 
     def getLOfreqs(self):
+        return tuple(column.tolist()
+                     for column in self.LOfreqs(self.getBlocks()))
+
+    def getSSBtunings(self):
+        return tuple(column.tolist()
+                     for column in self.SSBtunings(self.getBlocks()))
+
+    def getSHKdata(self, which):
+        """ Decode the file in a single pass.
+
+        Returns a dictionary with calibrated (stw, data) arrays for
+        every HKdata entry in which, together with the LO frequencies
+        and SSB tunings as returned by getLOfreqs and getSSBtunings,
+        but as numpy arrays. """
+        blocks = self.getBlocks()
+        hkdata = {}
+        for name in which:
+            table = HKdata[name]
+            stw, data = self.HKword(blocks, table[0], table[1])
+            hkdata[name] = (stw, table[2](data))
+        return hkdata, self.LOfreqs(blocks), self.SSBtunings(blocks)
+
+    def HKword(self, blocks, which, sub=-1):
+        word = blocks['words'][:, which]
+        found = (word != 0xffff)
+        if sub > -1:
+            found = ((word & 0x000f) == sub)
+            word = word >> 4
+        stw = blocks['stw'][found].astype('int64')
+        data = word[found].astype(int)
+        return stw, data
+
+    def LOfreqs(self, blocks):
         def sub(word):
             return word & 0x000f
 
         def freq(hro, pro, m):
             return ((4000.0 + hro) * m + pro / 32.0 + 100.0) * 6.0e6
-        self.rewind()
-        stw = []
-        aside = []
-        bside = []
-        words = self.getBlock()
-        while words:
-            stw.append(self.stw)
-            aside.append(int(words[21]))
-            bside.append(int(words[29]))
-            words = self.getBlock()
 
-        i = 0
-        STWa = []
-        STWb = []
-        LO495 = []
-        LO549 = []
-        LO555 = []
-        LO572 = []
-        while i < len(stw) - 3:
-            if sub(aside[i]) == 0:
-                STWa.append(stw[i])
-                if sub(aside[i]) == 0 and sub(aside[i + 1]) == 1:
-                    hro = aside[i] >> 4
-                    pro = aside[i + 1] >> 4
-                    LO495.append(freq(hro, pro, 17.0))
-                else:
-                    LO495.append(0.0)
-
-                if sub(aside[i + 2]) == 2 and sub(aside[i + 3]) == 3:
-                    hro = aside[i + 2] >> 4
-                    pro = aside[i + 3] >> 4
-                    LO549.append(freq(hro, pro, 19.0))
-                else:
-                    LO549.append(0.0)
-
-            if sub(bside[i]) == 0:
-                STWb.append(stw[i])
-                if sub(bside[i]) == 0 and sub(bside[i + 1]) == 1:
-                    hro = bside[i] >> 4
-                    pro = bside[i + 1] >> 4
-                    LO572.append(freq(hro, pro, 20.0))
-                else:
-                    LO572.append(0.0)
-
-                # print "%04x %04x %04x %04x" % \
-                #       (bside[i], bside[i+1], bside[i+2], bside[i+3])
-                if sub(bside[i + 2]) == 2 and sub(bside[i + 3]) == 3:
-                    hro = bside[i + 2] >> 4
-                    pro = bside[i + 3] >> 4
-                    LO555.append(freq(hro, pro, 19.0))
-                    # print LO555[-1]
-                else:
-                    LO555.append(0.0)
-                    #                i = i+4
-                    #            else:
-            i = i + 1
+        # the subcommutated HRO/PRO words of four consecutive blocks
+        # make up the LO frequencies of the A- and B-side receivers
+        n = max(len(blocks) - 3, 0)
+        stw = blocks['stw'][:n].astype('int64')
+        aside = [blocks['words'][i:i + n, 21].astype(int) for i in range(4)]
+        bside = [blocks['words'][i:i + n, 29].astype(int) for i in range(4)]
+
+        found = sub(aside[0]) == 0
+        STWa = stw[found]
+        LO495 = numpy.where(
+            sub(aside[1]) == 1,
+            freq(aside[0] >> 4, aside[1] >> 4, 17.0), 0.0)[found]
+        LO549 = numpy.where(
+            (sub(aside[2]) == 2) & (sub(aside[3]) == 3),
+            freq(aside[2] >> 4, aside[3] >> 4, 19.0), 0.0)[found]
+
+        found = sub(bside[0]) == 0
+        STWb = stw[found]
+        LO572 = numpy.where(
+            sub(bside[1]) == 1,
+            freq(bside[0] >> 4, bside[1] >> 4, 20.0), 0.0)[found]
+        LO555 = numpy.where(
+            (sub(bside[2]) == 2) & (sub(bside[3]) == 3),
+            freq(bside[2] >> 4, bside[3] >> 4, 19.0), 0.0)[found]
 
         return (STWa, LO495, LO549, STWb, LO555, LO572)
 
-    def getSSBtunings(self):
+    def SSBtunings(self, blocks):
         def sub(word):
             return word & 0x000f
-        self.rewind()
-        stw = []
-        aside = []
-        bside = []
-        which = []
-        words = self.getBlock()
-        while words:
-            stw.append(self.stw)
-            if words[35] != 0xffff and words[36] != 0xffff:
-                aside.append(words[35])
-                bside.append(words[36])
-                which.append('A')
-            else:
-                aside.append(words[41])
-                bside.append(words[42])
-                which.append('B')
-            words = self.getBlock()
 
-        i = 0
-        STW = []
-        SSB495 = []
-        SSB549 = []
-        SSB555 = []
-        SSB572 = []
-        while i < len(stw) - 2:
-            if sub(aside[i]) == 0 and sub(bside[i]) == 0 \
-               and sub(aside[i + 2]) == 2 and sub(bside[i + 2]) == 2:
-                STW.append(stw[i])
-                if which[i] == 'A':
-                    SSB495.append(aside[i] >> 4)
-                    SSB572.append(aside[i + 2] >> 4)
-                    SSB549.append(bside[i] >> 4)
-                    SSB555.append(bside[i + 2] >> 4)
-                else:
-                    SSB495.append(aside[i + 2] >> 4)
-                    SSB572.append(aside[i] >> 4)
-                    SSB549.append(bside[i + 2] >> 4)
-                    SSB555.append(bside[i] >> 4)
-                i = i + 2
-            else:
-                i = i + 1
+        words = blocks['words']
+        mechA = (words[:, 35] != 0xffff) & (words[:, 36] != 0xffff)
+        aside = numpy.where(mechA, words[:, 35], words[:, 41]).astype(int)
+        bside = numpy.where(mechA, words[:, 36], words[:, 42]).astype(int)
+
+        n = max(len(blocks) - 2, 0)
+        found = (sub(aside[:n]) == 0) & (sub(bside[:n]) == 0) & \
+            (sub(aside[2:n + 2]) == 2) & (sub(bside[2:n + 2]) == 2)
+        # a tuning spans two blocks, so within a run of consecutive
+        # matches only every second one starts a new tuning
+        start = numpy.nonzero(found & ~numpy.r_[False, found[:-1]])[0]
+        first = numpy.zeros(n, dtype=int)
+        first[start] = start
+        first = numpy.maximum.accumulate(first)
+        found &= (numpy.arange(n) - first) % 2 == 0
+
+        STW = blocks['stw'][:n][found].astype('int64')
+        mechA = mechA[:n][found]
+        a0, a2 = aside[:n][found] >> 4, aside[2:n + 2][found] >> 4
+        b0, b2 = bside[:n][found] >> 4, bside[2:n + 2][found] >> 4
+        SSB495 = numpy.where(mechA, a0, a2)
+        SSB572 = numpy.where(mechA, a2, a0)
+        SSB549 = numpy.where(mechA, b0, b2)
+        SSB555 = numpy.where(mechA, b2, b0)
 
         return (STW, SSB495, SSB549, SSB555, SSB572)
 
@@ -351,6 +349,21 @@ class FBAfile(Level0File):
         type = phase[mirror]
         return type
 
+    def getSpectrumHeads(self):
+        """ Bulk version of getSpectrumHead, returns the blocks of all
+        spectrum heads in the file """
+        blocks = self.getBlocks()
+        found = (blocks['sync'] == 0x2bd3) & (blocks['user'] == self.block0)
+        return blocks[found]
+
+    def Types(self, words):
+        """ Vectorized version of Type for an array of heads """
+        phase = numpy.array(['REF', 'SK1', 'CAL', 'SK2'])
+        mirror = numpy.where(words[:, 5] != 0xffff, words[:, 5], words[:, 6])
+        mirror = numpy.where(mirror != 0xffff, mirror, 0)
+        mirror = (mirror >> 13) & 3
+        return phase[mirror]
+
 
 class ACfile(Level0File):
     """ A derived  class to handle Odin level 0 AC1 and AC2 files """
@@ -372,6 +385,26 @@ class ACfile(Level0File):
             words = self.getBlock()
         return None
 
+    def getSpectrumHeads(self, blocks=None):
+        """ Bulk version of getSpectrumHead, returns the block numbers of
+        all spectrum heads in the file which are followed by the complete
+        set of 12 data blocks """
+        if blocks is None:
+            blocks = self.getBlocks()
+        found = (blocks['sync'] == 0x2bd3) & (blocks['user'] == self.block0)
+        heads = numpy.nonzero(found)[0]
+        if numpy.any(numpy.diff(heads) < 13):
+            # reading sequentially, the data blocks following a head are
+            # never taken for a new head
+            keep = []
+            next = 0
+            for head in heads:
+                if head >= next:
+                    keep.append(head)
+                    next = head + 13
+            heads = numpy.array(keep, dtype=heads.dtype)
+        return heads[heads + 12 < len(blocks)]
+
     def Attenuation(self, words):
         att = [0] * 4
         for i in range(4):
@@ -438,6 +471,28 @@ class ACfile(Level0File):
             type = 'REF'
         return type
 
+    def Frontends(self, words):
+        """ Vectorized version of Frontend for an array of heads """
+        frontend = numpy.array(
+            [None, '549', '495', '572', '555', 'SPL', '119'] + [None] * 9,
+            dtype=object)
+        input = words[:, 36] >> 8 & 0x000f
+        return frontend[input]
+
+    def Types(self, words):
+        """ Vectorized version of Type for an array of heads """
+        rx = self.Frontends(words)
+        chop = words[:, 8] == 0xaaaa
+        ref = numpy.isin(rx, ['495', '549'])
+        sig = numpy.isin(rx, ['555', '572', '119'])
+        if self.type == 'AC1':
+            ref |= rx == 'SPL'
+        else:
+            sig |= rx == 'SPL'
+        type = numpy.where(chop, 'SIG', 'REF')
+        type = numpy.where(ref, numpy.where(chop, 'REF', 'SIG'), type)
+        return numpy.where(ref | sig, type, 'NAN')
+
     def CmdTime(self, words):
         tcmd = float(words[35] & 0xff) / 16.0
         return tcmd
@@ -453,6 +508,16 @@ class ACfile(Level0File):
         inttime = float(samples) / 10.0e6
         return inttime
 
+    def IntTimes(self, words):
+        """ Vectorized version of IntTime for an array of heads """
+        prescaler = words[:, 49].astype('int64')
+        valid = (prescaler >= 2) & (prescaler <= 6)
+        samples = (0x0000ffff & words[:, 12]).astype('int64')
+        samples = samples << numpy.where(valid, 14 - prescaler, 0)
+        samples = numpy.where(valid, samples, 0)
+        inttime = samples.astype(float) / 10.0e6
+        return inttime
+
     def Mode(self, words):
         mode = words[35] >> 8 & 0x00ff
         # bands = 0
@@ -466,6 +531,10 @@ class ACfile(Level0File):
         #     bands = 1
         return mode
 
+    def Modes(self, words):
+        """ Vectorized version of Mode for an array of heads """
+        return (words[:, 35] >> 8 & 0x00ff).astype(int)
+
     def ZeroLags(self, words):
         bands = self.Mode(words)
         zlag = [0.0] * bands
@@ -610,16 +679,12 @@ def main():
         which = sys.argv[1]
         # print len(sys.argv)
         if which in HKdata:
-            table = HKdata[which]
-            # print table
             for i in range(2, len(sys.argv)):
                 sys.stderr.write("next file '%s'\n" % (sys.argv[i]))
                 shk = SHKfile(sys.argv[i])
                 # print shk.first, shk.last
-                stw, HK = shk.getHKword(table[0], sub=table[1])
-                if table[2]:
-                    f = table[2]
-                    HK = map(f, HK)
+                hkdata = shk.getSHKdata([which])[0]
+                stw, HK = [column.tolist() for column in hkdata[which]]
                 if HK:
                     # for i in range(0, len(stw)):
                     #    print "%10d %10.3f" % (stw[i], HK[i])
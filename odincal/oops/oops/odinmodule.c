@@ -1757,6 +1757,159 @@ PyObject *ACfile(PyObject *self, PyObject *args)
     return (PyObject *)obj;
 }
 
+/************************** attitude **************************/
+
+static PyArrayObject *attitudeInput(PyObject *obj, int type, int n, int m)
+{
+    PyArrayObject *array;
+    int ok;
+
+    array = (PyArrayObject *)PyArray_ContiguousFromObject(obj, type, 1, 2);
+    if (array == NULL) return NULL;
+    if (m == 0) ok = (array->nd == 1 && array->dimensions[0] == n);
+    else ok = (array->nd == 2 && array->dimensions[0] == n 
+	       && array->dimensions[1] == m);
+    if (!ok) {
+	PyErr_SetString(PyExc_ValueError, "attitude arrays of wrong shape");
+	Py_DECREF(array);
+	return NULL;
+    }
+    return array;
+}
+
+static int attitudeOutput(PyObject *dict, char *name, int type, 
+			  int n, int m, PyArrayObject **array)
+{
+    int dimensions[2];
+
+    dimensions[0] = n;
+    dimensions[1] = m;
+    *array = (PyArrayObject *)PyArray_FromDims(m ? 2 : 1, dimensions, type);
+    if (*array == NULL) return 0;
+    if (PyDict_SetItemString(dict, name, (PyObject *)*array) < 0) {
+	Py_DECREF(*array);
+	return 0;
+    }
+    Py_DECREF(*array);
+    return 1;
+}
+
+/*
+  Calculate the attitude of a batch of spectra, the same way as the
+  Attitude method of a new Spectrum does for one spectrum. Takes arrays 
+  of n stw, JD, orbit, qt (n by 4), qa (n by 4), qe (n by 3), gps (n by 6) 
+  and acs, and returns a dictionary with arrays of the resulting members.
+*/
+static PyObject *Attitudes(PyObject *self, PyObject *args)
+{
+    PyObject *o[8], *dict;
+    PyArrayObject *in[8], *out[21];
+    unsigned long *stw;
+    double *JD, *orbit, *qt, *qa, *qe, *gps, *acs;
+    int shape[8] = { 0, 0, 0, 4, 4, 3, 6, 0 };
+    int types[8];
+    int i, j, n;
+
+    if (!PyArg_ParseTuple(args, "OOOOOOOO:Attitudes", 
+			  &o[0], &o[1], &o[2], &o[3], 
+			  &o[4], &o[5], &o[6], &o[7])) return NULL;
+
+    n = PyObject_Length(o[0]);
+    if (n < 0) return NULL;
+    for (i = 0; i < 8; i++) {
+	types[i] = (i == 0) ? PyArray_ULONG : PyArray_DOUBLE;
+	in[i] = attitudeInput(o[i], types[i], n, shape[i]);
+	if (in[i] == NULL) {
+	    for (j = 0; j < i; j++) Py_DECREF(in[j]);
+	    return NULL;
+	}
+    }
+
+    dict = PyDict_New();
+    if (dict == NULL
+	|| !attitudeOutput(dict, "mjd",        PyArray_DOUBLE, n, 0, &out[0])
+	|| !attitudeOutput(dict, "lst",        PyArray_FLOAT,  n, 0, &out[1])
+	|| !attitudeOutput(dict, "orbit",      PyArray_DOUBLE, n, 0, &out[2])
+	|| !attitudeOutput(dict, "latitude",   PyArray_FLOAT,  n, 0, &out[3])
+	|| !attitudeOutput(dict, "longitude",  PyArray_FLOAT,  n, 0, &out[4])
+	|| !attitudeOutput(dict, "altitude",   PyArray_FLOAT,  n, 0, &out[5])
+	|| !attitudeOutput(dict, "skybeamhit", PyArray_SHORT,  n, 0, &out[6])
+	|| !attitudeOutput(dict, "ra2000",     PyArray_FLOAT,  n, 0, &out[7])
+	|| !attitudeOutput(dict, "dec2000",    PyArray_FLOAT,  n, 0, &out[8])
+	|| !attitudeOutput(dict, "vsource",    PyArray_FLOAT,  n, 0, &out[9])
+	|| !attitudeOutput(dict, "qtarget",    PyArray_DOUBLE, n, 4, &out[10])
+	|| !attitudeOutput(dict, "qachieved",  PyArray_DOUBLE, n, 4, &out[11])
+	|| !attitudeOutput(dict, "qerror",     PyArray_DOUBLE, n, 3, &out[12])
+	|| !attitudeOutput(dict, "gpspos",     PyArray_DOUBLE, n, 3, &out[13])
+	|| !attitudeOutput(dict, "gpsvel",     PyArray_DOUBLE, n, 3, &out[14])
+	|| !attitudeOutput(dict, "sunpos",     PyArray_DOUBLE, n, 3, &out[15])
+	|| !attitudeOutput(dict, "moonpos",    PyArray_DOUBLE, n, 3, &out[16])
+	|| !attitudeOutput(dict, "sunzd",      PyArray_FLOAT,  n, 0, &out[17])
+	|| !attitudeOutput(dict, "vgeo",       PyArray_FLOAT,  n, 0, &out[18])
+	|| !attitudeOutput(dict, "vlsr",       PyArray_FLOAT,  n, 0, &out[19])
+	|| !attitudeOutput(dict, "level",      PyArray_USHORT, n, 0, &out[20])) {
+	Py_XDECREF(dict);
+	for (i = 0; i < 8; i++) Py_DECREF(in[i]);
+	return NULL;
+    }
+
+    stw   = (unsigned long *)in[0]->data;
+    JD    = (double *)in[1]->data;
+    orbit = (double *)in[2]->data;
+    qt    = (double *)in[3]->data;
+    qa    = (double *)in[4]->data;
+    qe    = (double *)in[5]->data;
+    gps   = (double *)in[6]->data;
+    acs   = (double *)in[7]->data;
+
+    for (i = 0; i < n; i++) {
+	memset(&s, 0, sizeof(struct OdinScan));
+	s.STW = stw[i];
+	s.MJD = jd2mjd(JD[i]);
+	s.Orbit = orbit[i];
+	for (j = 0; j < 4; j++) {
+	    s.Qtarget[j]   = qt[4*i+j];
+	    s.Qachieved[j] = qa[4*i+j];
+	    if (j < 3) s.Qerror[j] = qe[3*i+j];
+	}
+	for (j = 0; j < 3; j++) {
+	    s.GPSpos[j] = gps[6*i+j];
+	    s.GPSvel[j] = gps[6*i+j+3];
+	}
+
+	skybeams(&s, acs[i]);
+
+	((double *)out[0]->data)[i]          = s.MJD;
+	((float *)out[1]->data)[i]           = s.LST;
+	((double *)out[2]->data)[i]          = s.Orbit;
+	((float *)out[3]->data)[i]           = s.u.tp.Latitude;
+	((float *)out[4]->data)[i]           = s.u.tp.Longitude;
+	((float *)out[5]->data)[i]           = s.u.tp.Altitude;
+	((short *)out[6]->data)[i]           = s.SkyBeamHit;
+	((float *)out[7]->data)[i]           = s.RA2000;
+	((float *)out[8]->data)[i]           = s.Dec2000;
+	((float *)out[9]->data)[i]           = s.VSource;
+	for (j = 0; j < 4; j++) {
+	    ((double *)out[10]->data)[4*i+j] = s.Qtarget[j];
+	    ((double *)out[11]->data)[4*i+j] = s.Qachieved[j];
+	}
+	for (j = 0; j < 3; j++) {
+	    ((double *)out[12]->data)[3*i+j] = s.Qerror[j];
+	    ((double *)out[13]->data)[3*i+j] = s.GPSpos[j];
+	    ((double *)out[14]->data)[3*i+j] = s.GPSvel[j];
+	    ((double *)out[15]->data)[3*i+j] = s.SunPos[j];
+	    ((double *)out[16]->data)[3*i+j] = s.MoonPos[j];
+	}
+	((float *)out[17]->data)[i]          = s.SunZD;
+	((float *)out[18]->data)[i]          = s.Vgeo;
+	((float *)out[19]->data)[i]          = s.Vlsr;
+	((unsigned short *)out[20]->data)[i] = s.Level;
+    }
+
+    for (i = 0; i < 8; i++) Py_DECREF(in[i]);
+    return dict;
+}
+
 /************************** odin functions **************************/
 
 static PyMethodDef odin_functions[] = {
@@ -1764,6 +1917,7 @@ static PyMethodDef odin_functions[] = {
     { "FBAfile",  FBAfile,     METH_VARARGS },
     { "AOSfile",  AOSfile,     METH_VARARGS },
     { "ACfile",   ACfile,      METH_VARARGS },
+    { "Attitudes", Attitudes,  METH_VARARGS },
     { "Polyfit",  Polyfit,     METH_VARARGS },
     { "LogAs",    LogAs,       METH_VARARGS },
     { "Warn",     Warn,        METH_VARARGS },
@@ -0,0 +1,43 @@
+import numpy
+import pytest
+
+from oops import odin
+
+MEMBERS = [
+    'mjd', 'lst', 'orbit', 'latitude', 'longitude', 'altitude', 'skybeamhit',
+    'ra2000', 'dec2000', 'vsource', 'qtarget', 'qachieved', 'qerror',
+    'gpspos', 'gpsvel', 'sunpos', 'moonpos', 'sunzd', 'vgeo', 'vlsr', 'level']
+
+
+def make_attitude(n):
+    rng = numpy.random.RandomState(1)
+    stw = numpy.arange(n, dtype='uint64') * 160 + 0x8f000000
+    jd = 2457085.5 + numpy.arange(n) * 10.0 / 86400
+    orbit = 50000 + numpy.arange(n) / 590.0
+    qt = rng.normal(size=(n, 4))
+    qt /= numpy.sqrt((qt ** 2).sum(axis=1))[:, numpy.newaxis]
+    qa = qt + rng.normal(scale=1e-4, size=(n, 4))
+    qe = rng.normal(scale=1e-3, size=(n, 3))
+    gps = [7.0e6, 1.0e5, 2.0e5, 10.0, 7500.0, 20.0] + rng.normal(size=(n, 6))
+    acs = numpy.array([0.0, 0.5, 1.0, 0.0, 0.0])[:n]
+    return stw, jd, orbit, qt, qa, qe, gps, acs
+
+
+def test_attitudes_match_the_attitude_of_spectra():
+    args = make_attitude(5)
+    attitudes = odin.Attitudes(*args)
+    for i in range(5):
+        s = odin.Spectrum()
+        s.stw = long(args[0][i])
+        s.Attitude((args[1][i], long(args[0][i]), args[2][i],
+                    tuple(args[3][i]), tuple(args[4][i]), tuple(args[5][i]),
+                    tuple(args[6][i]), args[7][i]))
+        for member in MEMBERS:
+            assert attitudes[member][i].tolist() == getattr(s, member)
+
+
+def test_attitudes_of_arrays_of_wrong_shape():
+    args = list(make_attitude(3))
+    args[3] = args[3][:, :3]
+    with pytest.raises(ValueError):
+        odin.Attitudes(*args)